@@ -0,0 +1,250 @@
+import json
+from functools import wraps
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.http import require_http_methods
+
+from .models import Comment, Listing
+from .money import parse_amount
+from .pagination import PAGE_SIZE, parse_cursor
+from .services import BidRejected, place_bid, post_comment, unwatch_listings, watch_listings
+
+
+MAX_PAGE_SIZE = 500
+MAX_BULK_WATCHLIST = 500
+
+# public field name -> .values() lookup
+LISTING_FIELDS = {
+    "id": "id",
+    "title": "title",
+    "description": "description",
+    "image_url": "image_url",
+    "bid_current": "bid_current",
+    "bid_count": "bid_count",
+    "comment_count": "comment_count",
+    "is_active": "is_active",
+    "ends_at": "ends_at",
+    "category": "category__slug",
+    "seller": "seller__username",
+    "high_bidder": "high_bidder__username",
+}
+LISTING_DEFAULT_FIELDS = ["id", "title", "image_url", "bid_current", "bid_count", "category"]
+
+COMMENT_FIELDS = {
+    "id": "id",
+    "author": "author__username",
+    "message": "message",
+}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def error(message, status):
+    return JsonResponse({"error": message}, status=status)
+
+
+def api_login_required(view):
+    # like login_required, but answers 401 instead of redirecting to the login page
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return error("Authentication required.", 401)
+        return view(request, *args, **kwargs)
+    return wrapper
+
+
+def selected_fields(request, available, default):
+    # ?fields=id,title sparse fieldsets, the id is always needed for the cursor
+    requested = request.GET.get("fields")
+    names = [name.strip() for name in requested.split(",") if name.strip()] if requested else default
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise BadRequest(f"Unknown fields: {', '.join(unknown)}.")
+    if "id" not in names:
+        names = ["id"] + names
+    return names
+
+
+def page_size(request):
+    try:
+        size = int(request.GET.get("limit", PAGE_SIZE))
+    except ValueError:
+        raise BadRequest("limit must be a number.")
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def request_data(request):
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or "{}")
+        except ValueError:
+            raise BadRequest("Invalid JSON body.")
+        if not isinstance(data, dict):
+            raise BadRequest("Expected a JSON object.")
+        return data
+    return request.POST
+
+
+def values_page(queryset, names, available, after, size):
+    # one .values() query, rows renamed to the public field names
+    lookups = [available[name] for name in names]
+    if after is not None:
+        queryset = queryset.filter(id__gt=after)
+    rows = queryset.order_by("id").values(*lookups)[:size + 1]
+    for row in rows.iterator():
+        yield {name: row[lookup] for name, lookup in zip(names, lookups)}
+
+
+def stream_page(rows, size):
+    # results are written as they are read, the next cursor goes last
+    encoder = DjangoJSONEncoder()
+    yield '{"results": ['
+    last_id = None
+    for count, row in enumerate(rows):
+        if count == size:
+            yield '], "next": ' + encoder.encode(last_id) + "}"
+            return
+        yield ("," if count else "") + encoder.encode(row)
+        last_id = row["id"]
+    yield '], "next": null}'
+
+
+def list_response(request, queryset, available, default):
+    try:
+        names = selected_fields(request, available, default)
+        size = page_size(request)
+    except BadRequest as bad_request:
+        return error(str(bad_request), 400)
+    # the rows are read while the response streams, after ReadYourWritesMiddleware
+    # has returned, so the alias is chosen now while the request's pin still holds
+    queryset = queryset.using(router.db_for_read(queryset.model))
+    rows = values_page(queryset, names, available, parse_cursor(request.GET.get("after")), size)
+    return StreamingHttpResponse(stream_page(rows, size), content_type="application/json")
+
+
+# ---- start listings ----
+@require_http_methods(["GET"])
+def listings(request):
+    queryset = Listing.objects.filter(is_active=True)
+    if request.GET.get("category"):
+        queryset = queryset.filter(category__slug=request.GET["category"])
+    return list_response(request, queryset, LISTING_FIELDS, LISTING_DEFAULT_FIELDS)
+
+
+@require_http_methods(["GET"])
+def listing_detail(request, listing_id):
+    try:
+        names = selected_fields(request, LISTING_FIELDS, list(LISTING_FIELDS))
+    except BadRequest as bad_request:
+        return error(str(bad_request), 400)
+    lookups = [LISTING_FIELDS[name] for name in names]
+    row = Listing.objects.filter(pk=listing_id).values(*lookups).first()
+    if row is None:
+        return error("Listing not found.", 404)
+    return JsonResponse({name: row[lookup] for name, lookup in zip(names, lookups)})
+# ---- end listings ----
+
+
+# ---- start bids ----
+@require_http_methods(["POST"])
+@api_login_required
+def bids(request, listing_id):
+    try:
+        amount = parse_amount(request_data(request).get("amount"))
+    except BadRequest as bad_request:
+        return error(str(bad_request), 400)
+    except ValueError:
+        return error("amount must be a number with at most two decimals.", 400)
+    try:
+        place_bid(listing_id, request.user, amount)
+    except BidRejected as rejected:
+        return error(str(rejected), 409)
+    return JsonResponse({"listing": listing_id, "bid_current": amount}, status=201)
+# ---- end bids ----
+
+
+# ---- start comments ----
+@require_http_methods(["GET", "POST"])
+def comments(request, listing_id):
+    if request.method == "GET":
+        queryset = Comment.objects.filter(listing_id=listing_id)
+        return list_response(request, queryset, COMMENT_FIELDS, list(COMMENT_FIELDS))
+
+    return add_comment(request, listing_id)
+
+
+@api_login_required
+def add_comment(request, listing_id):
+    try:
+        message = request_data(request).get("message") or ""
+    except BadRequest as bad_request:
+        return error(str(bad_request), 400)
+    if not isinstance(message, str):
+        return error("message must be a string.", 400)
+    message = message.strip()
+    if not message:
+        return error("message is required.", 400)
+    try:
+        comment = post_comment(listing_id, request.user, message)
+    except Listing.DoesNotExist:
+        return error("Listing not found.", 404)
+    return JsonResponse(
+        {"id": comment.id, "author": request.user.username, "message": message}, status=201
+    )
+# ---- end comments ----
+
+
+# ---- start watchlist ----
+@require_http_methods(["GET"])
+@api_login_required
+def watchlist(request):
+    queryset = Listing.objects.filter(userwatchlist__user=request.user)
+    return list_response(request, queryset, LISTING_FIELDS, LISTING_DEFAULT_FIELDS)
+
+
+@require_http_methods(["PUT", "POST", "DELETE"])
+@api_login_required
+def watchlist_entry(request, listing_id):
+    if request.method == "DELETE":
+        unwatch_listings(request.user, [listing_id])
+        return JsonResponse({"listing": listing_id, "watching": False})
+    if not Listing.objects.filter(pk=listing_id).exists():
+        return error("Listing not found.", 404)
+    # adding a listing that is already watched is a no-op
+    watch_listings(request.user, [listing_id])
+    return JsonResponse({"listing": listing_id, "watching": True})
+
+
+def listing_ids(data, name):
+    ids = data.get(name) or []
+    if not isinstance(ids, list) or not all(type(value) is int for value in ids):
+        raise BadRequest(f"{name} must be a list of listing ids.")
+    return set(ids)
+
+
+@require_http_methods(["POST"])
+@api_login_required
+def watchlist_bulk(request):
+    # {"add": [ids], "remove": [ids]}: one SELECT, one INSERT and one DELETE at most
+    try:
+        data = request_data(request)
+        add, remove = listing_ids(data, "add"), listing_ids(data, "remove")
+    except BadRequest as bad_request:
+        return error(str(bad_request), 400)
+    if len(add) + len(remove) > MAX_BULK_WATCHLIST:
+        return error(f"At most {MAX_BULK_WATCHLIST} listings per request.", 400)
+    if add & remove:
+        return error("A listing can't be added and removed at once.", 400)
+    if add:
+        found = set(Listing.objects.filter(pk__in=add).values_list("id", flat=True))
+        if found != add:
+            return error(f"Listings not found: {', '.join(map(str, sorted(add - found)))}.", 404)
+        watch_listings(request.user, sorted(add))
+    if remove:
+        unwatch_listings(request.user, remove)
+    return JsonResponse({"added": sorted(add), "removed": sorted(remove)})
+# ---- end watchlist ----
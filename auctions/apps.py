@@ -1,5 +1,19 @@
 from django.apps import AppConfig
+from django.core import checks
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_migrate, post_save
 
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        from .auth import check_shared_caches, invalidate_user
+        from .search import install_search_triggers
+        from .sqlite import configure_sqlite
+        checks.register(check_shared_caches)
+        post_migrate.connect(install_search_triggers, sender=self)
+        connection_created.connect(configure_sqlite)
+        user = self.get_model("User")
+        post_save.connect(invalidate_user, sender=user)
+        post_delete.connect(invalidate_user, sender=user)
@@ -0,0 +1,66 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+from django.core.checks import Error
+from django.db import transaction
+
+from .routers import use_primary
+
+
+USER_KEY = "auctions:user:{}"
+
+
+def user_cache():
+    # holds whole User rows, password hashes included: keep it as private as the sessions
+    return caches[getattr(settings, "USER_CACHE_ALIAS", "default")]
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that keeps the signed-in user in the cache between requests.
+
+    AuthenticationMiddleware loads request.user from the session on every request,
+    with this backend that is a cache read instead of a User SELECT. Saving or
+    deleting the user drops the entry, so password changes and deactivations apply
+    on the next request.
+    """
+
+    def get_user(self, user_id):
+        key = USER_KEY.format(user_id)
+        user = user_cache().get(key)
+        if user is None:
+            # None for missing and inactive users, which are never cached. Read from
+            # the primary so a password change or deactivation isn't undone by a replica
+            with use_primary():
+                user = super().get_user(user_id)
+            if user is not None:
+                user_cache().set(key, user, getattr(settings, "USER_CACHE_TIMEOUT", 300))
+        return user
+
+
+def invalidate_user(sender, instance, **kwargs):
+    key = USER_KEY.format(instance.pk)
+    user_cache().delete(key)
+    transaction.on_commit(lambda: user_cache().delete(key))
+
+
+def check_shared_caches(app_configs, **kwargs):
+    # a per-process cache would keep logged out sessions and deactivated users valid
+    # in every other worker
+    aliases = set()
+    if settings.SESSION_ENGINE in (
+        "django.contrib.sessions.backends.cache", "django.contrib.sessions.backends.cached_db",
+    ):
+        aliases.add(settings.SESSION_CACHE_ALIAS)
+    if "auctions.auth.CachedModelBackend" in settings.AUTHENTICATION_BACKENDS:
+        aliases.add(getattr(settings, "USER_CACHE_ALIAS", "default"))
+    if settings.DEBUG:
+        return []
+    return [
+        Error(
+            f"The {alias!r} cache holds sessions or signed-in users but is local to each process.",
+            hint="Use a cache shared by all workers (file based, Redis or Memcached).",
+            id="auctions.E001",
+        )
+        for alias in sorted(aliases)
+        if settings.CACHES[alias]["BACKEND"] == "django.core.cache.backends.locmem.LocMemCache"
+    ]
@@ -0,0 +1,178 @@
+import random
+import statistics
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from .cache import fragment_cache, listing_cache
+from .models import Bid, Category, Comment, Listing, User, UserWatchlist
+
+
+# ---- start synthetic data ----
+def generate_data(users=50, categories=10, listings=1000, bids=5, comments=3, seed=1):
+    # everything goes through bulk_create, a few statements per model whatever the sizes
+    rng = random.Random(seed)
+    password = make_password("benchmark")
+    User.objects.bulk_create([
+        User(username=f"bench{n}", email=f"bench{n}@example.com", password=password)
+        for n in range(users)
+    ], batch_size=1000)
+    user_ids = list(User.objects.filter(username__startswith="bench").values_list("id", flat=True))
+
+    Category.objects.bulk_create([
+        Category(name=f"Category {n}", slug=f"category-{n}") for n in range(categories)
+    ])
+    category_ids = list(Category.objects.values_list("id", flat=True))
+
+    Listing.objects.bulk_create([
+        Listing(
+            title=f"Listing {n}",
+            description=f"Synthetic listing number {n}",
+            image_url=f"https://example.com/{n}.jpg",
+            bid_current=rng.randint(1, 100),
+            seller_id=rng.choice(user_ids),
+            category_id=rng.choice(category_ids),
+        )
+        for n in range(listings)
+    ], batch_size=1000)
+    listing_rows = list(Listing.objects.values_list("id", "bid_current"))
+
+    new_bids, new_comments, watched, leaders = [], [], [], []
+    for listing_id, price in listing_rows:
+        bidder_id = None
+        for _ in range(bids):
+            price += rng.randint(1, 10)
+            bidder_id = rng.choice(user_ids)
+            new_bids.append(Bid(listing_id=listing_id, bidder_id=bidder_id, amount=price))
+        for n in range(comments):
+            new_comments.append(Comment(
+                listing_id=listing_id, author_id=rng.choice(user_ids), message=f"Comment {n}"
+            ))
+        for user_id in rng.sample(user_ids, min(2, len(user_ids))):
+            watched.append(UserWatchlist(user_id=user_id, listing_id=listing_id))
+        leaders.append(Listing(
+            id=listing_id, bid_current=price, bid_count=bids,
+            high_bidder_id=bidder_id, comment_count=comments,
+        ))
+    Bid.objects.bulk_create(new_bids, batch_size=1000)
+    Comment.objects.bulk_create(new_comments, batch_size=1000)
+    UserWatchlist.objects.bulk_create(watched, batch_size=1000, ignore_conflicts=True)
+    Listing.objects.bulk_update(
+        leaders, ["bid_current", "bid_count", "high_bidder", "comment_count"], batch_size=1000
+    )
+# ---- end synthetic data ----
+
+
+# ---- start view scenarios ----
+def scenarios(rng):
+    listing_ids = list(Listing.objects.values_list("id", flat=True))
+    slugs = list(Category.objects.values_list("slug", flat=True))
+    middle = listing_ids[len(listing_ids) // 2]
+    return {
+        "index": lambda client: client.get(reverse("index")),
+        "index_page": lambda client: client.get(reverse("index"), {"after": middle}),
+        "category_listings": lambda client: client.get(
+            reverse("category_listings", args=(rng.choice(slugs),))
+        ),
+        "listing_by_id": lambda client: client.get(reverse("listing", args=(rng.choice(listing_ids),))),
+        "add_bid": lambda client: client.post(
+            reverse("add_bid", args=(rng.choice(listing_ids),)), {"bid_amount": rng.randint(1, 10 ** 6)}
+        ),
+        "personal_watchlist": lambda client: client.get(reverse("watchlist")),
+    }
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(scenario, client, requests, warmup=5):
+    for _ in range(warmup):
+        scenario(client)
+    timings, queries = [], []
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as ctx:
+            began = time.perf_counter()
+            response = scenario(client)
+            timings.append((time.perf_counter() - began) * 1000)
+        if response.status_code >= 400:
+            raise RuntimeError(f"benchmark request answered {response.status_code}")
+        queries.append(len(ctx.captured_queries))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": requests,
+        "p50_ms": round(percentile(timings, 0.50), 3),
+        "p95_ms": round(percentile(timings, 0.95), 3),
+        "p99_ms": round(percentile(timings, 0.99), 3),
+        "queries_per_request": round(statistics.mean(queries), 2),
+        "requests_per_second": round(requests / elapsed, 1),
+    }
+
+
+def run_benchmarks(requests=200, only=None, seed=1):
+    rng = random.Random(seed)
+    client = Client()
+    client.force_login(User.objects.filter(username__startswith="bench").first())
+    results = {}
+    for name, scenario in scenarios(rng).items():
+        if only and name not in only:
+            continue
+        results[name] = measure(scenario, client, requests)
+    return results
+# ---- end view scenarios ----
+
+
+# ---- start session backends ----
+SESSION_CONFIGURATIONS = {
+    # a session SELECT and a User SELECT on every signed-in request
+    "db": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.db",
+        "AUTHENTICATION_BACKENDS": ["django.contrib.auth.backends.ModelBackend"],
+    },
+    "cached_db": {
+        "SESSION_ENGINE": "django.contrib.sessions.backends.cached_db",
+        "AUTHENTICATION_BACKENDS": ["auctions.auth.CachedModelBackend"],
+    },
+}
+
+
+def compare_session_backends(requests=200, views=("index", "listing_by_id"), seed=1):
+    # the same signed-in requests under each session/auth configuration
+    user = User.objects.filter(username__startswith="bench").first()
+    results = {}
+    for label, overrides in SESSION_CONFIGURATIONS.items():
+        # both runs start cold, only the session handling differs
+        listing_cache().clear()
+        fragment_cache().clear()
+        with override_settings(**overrides):
+            client = Client()
+            client.force_login(user)
+            available = scenarios(random.Random(seed))
+            results[label] = {name: measure(available[name], client, requests) for name in views}
+    return results
+# ---- end session backends ----
+
+
+# ---- start baseline comparison ----
+def compare_to_baseline(results, baseline, tolerance=0.25):
+    # slower p95 beyond the tolerance, or any extra query per request, is a regression
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current["queries_per_request"] > previous["queries_per_request"]:
+            regressions.append(
+                f"{name}: queries/request {previous['queries_per_request']} -> "
+                f"{current['queries_per_request']}"
+            )
+    return regressions
+# ---- end baseline comparison ----
@@ -0,0 +1,146 @@
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import InvalidCacheBackendError, caches
+from django.db import transaction
+
+from .models import Comment, Listing, UserWatchlist
+from .pagination import COMMENT_PAGE_SIZE, keyset_paginate
+from .routers import use_primary
+
+
+LISTING_KEY = "auctions:listing:{}"
+
+_stats_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+
+def listing_cache():
+    # any configured backend works, LocMem unless settings point elsewhere
+    return caches[getattr(settings, "LISTING_CACHE_ALIAS", "default")]
+
+
+def listing_cache_enabled():
+    return getattr(settings, "LISTING_CACHE_ENABLED", True)
+
+
+def _count(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+
+
+def cache_stats():
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_cache_stats():
+    with _stats_lock:
+        for outcome in _stats:
+            _stats[outcome] = 0
+
+
+def comment_page(listing_id, after=None):
+    # newest first, each page a range scan of the (listing, id) index; older pages
+    # are fetched on demand by the listing_comments fragment
+    comments = (
+        Comment.objects.filter(listing_id=listing_id)
+        .select_related("author")
+        .only("id", "message", "listing_id", "author__id", "author__username")
+    )
+    return keyset_paginate(comments, after=after, page_size=COMMENT_PAGE_SIZE, descending=True)
+
+
+def load_listing_snapshot(listing_id):
+    # only the user columns the page shows end up in the cache, never password hashes
+    # the leading bid is denormalized on the listing, no Bid query needed
+    listing = (
+        Listing.objects.select_related("seller", "category", "high_bidder")
+        .only(
+            "id", "title", "description", "image_url", "bid_current", "is_active",
+            "bid_count", "comment_count", "ends_at", "image_large", "updated_at",
+            "seller__id", "seller__username", "category__id", "category__name", "category__slug",
+            "high_bidder__id", "high_bidder__username",
+        )
+        .get(pk=listing_id)
+    )
+    return {"listing": listing, "comments": comment_page(listing.id)}
+
+
+def get_listing_snapshot(listing_id, updated_at=None):
+    # read-through: listing, leading bid and comments come from one cache entry.
+    # invalidate_listing only reaches this process's cache, a snapshot older than
+    # the updated_at the caller has read is reloaded
+    if not listing_cache_enabled():
+        return load_listing_snapshot(listing_id)
+
+    key = LISTING_KEY.format(listing_id)
+    cache = listing_cache()
+    snapshot = cache.get(key)
+    if snapshot is not None and (updated_at is None or snapshot["listing"].updated_at >= updated_at):
+        _count("hits")
+        return snapshot
+
+    _count("misses")
+    # right after invalidate_listing a replica may not have the write yet
+    with use_primary():
+        snapshot = load_listing_snapshot(listing_id)
+    cache.set(key, snapshot, getattr(settings, "LISTING_CACHE_TIMEOUT", 300))
+    return snapshot
+
+
+def invalidate_listing(listing_id):
+    key = LISTING_KEY.format(listing_id)
+    listing_cache().delete(key)
+    # and again once the write is visible, in case a reader cached the old state meanwhile
+    transaction.on_commit(lambda: listing_cache().delete(key))
+
+
+def invalidate_listings(listing_ids):
+    keys = [LISTING_KEY.format(listing_id) for listing_id in listing_ids]
+    listing_cache().delete_many(keys)
+    transaction.on_commit(lambda: listing_cache().delete_many(keys))
+
+
+# ---- start watched listings ----
+WATCHED_KEY = "auctions:watched:{}"
+
+
+def watched_listings(user):
+    """{"ids": frozenset of watched listing ids, "version": ...} for ``user``.
+
+    Loaded with one query the first time, then read from the cache until the user's
+    watchlist changes. The version feeds the ETags of pages that show watch state.
+    """
+    if not user.is_authenticated:
+        return {"ids": frozenset(), "version": None}
+    key = WATCHED_KEY.format(user.pk)
+    watched = listing_cache().get(key)
+    if watched is None:
+        with use_primary():
+            ids = frozenset(UserWatchlist.objects.filter(user_id=user.pk).values_list("listing_id", flat=True))
+        watched = {"ids": ids, "version": time.time_ns()}
+        listing_cache().set(key, watched, getattr(settings, "WATCHLIST_CACHE_TIMEOUT", 3600))
+    return watched
+
+
+def watched_ids(user):
+    return watched_listings(user)["ids"]
+
+
+def invalidate_watched(user_id):
+    key = WATCHED_KEY.format(user_id)
+    listing_cache().delete(key)
+    transaction.on_commit(lambda: listing_cache().delete(key))
+# ---- end watched listings ----
+
+
+# ---- start template fragments ----
+def fragment_cache():
+    # the same lookup as the {% cache %} tag
+    try:
+        return caches["template_fragments"]
+    except InvalidCacheBackendError:
+        return caches["default"]
+# ---- end template fragments ----
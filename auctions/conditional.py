@@ -0,0 +1,125 @@
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.db.models import OuterRef, Subquery
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+from .cache import watched_listings
+from .leaderboard import hot_listing_ids
+from .models import Category, Listing
+
+
+def _latest(queryset):
+    # MAX(updated_at) as ORDER BY ... LIMIT 1, served by the updated_at indexes
+    return Subquery(queryset.order_by("-updated_at").values("updated_at")[:1])
+
+
+def _newest(*moments):
+    moments = [moment for moment in moments if moment is not None]
+    return max(moments) if moments else None
+
+
+# ---- start page markers ----
+# each marker is one query returning (last modified, extra etag parts), or None
+# when the page has nothing to compare against and the view should just render.
+# What the view also needs is left on the request
+def listing_marker(request, listing_id):
+    updated_at = Listing.objects.filter(pk=listing_id).values_list("updated_at", flat=True).first()
+    request.listing_updated_at = updated_at
+    if updated_at is None:
+        return None
+    return updated_at, ()
+
+
+def category_marker(request, slug=None):
+    if slug is None:
+        return None
+    row = (
+        Category.objects.filter(slug=slug)
+        .annotate(listings_updated=_latest(Listing.objects.filter(category=OuterRef("pk"))))
+        .values_list("updated_at", "listings_updated")
+        .first()
+    )
+    if row is None:
+        return None
+    return _newest(*row), ()
+
+
+def index_marker(request):
+    # the grid, the category dropdown and the hot strip feed the page, the strip
+    # can change with time alone as bids leave the window
+    row = (
+        Listing.objects.annotate(categories_updated=_latest(Category.objects.all()))
+        .order_by("-updated_at")
+        .values_list("updated_at", "categories_updated")
+        .first()
+    )
+    if row is None:
+        return None
+    request.categories_updated = row[1]
+    return _newest(*row), tuple(hot_listing_ids())
+# ---- end page markers ----
+
+
+# ---- start conditional responses ----
+def page_etag(request, last_modified, parts):
+    version = [request.get_full_path(), last_modified.isoformat(), *map(str, parts)]
+    if request.user.is_authenticated:
+        # the page shows the username and carries a CSRF token, which is rotated on
+        # login together with the session, so neither can leak across sessions.
+        # Watch state shows on cards and listing pages, it changes with the watchlist
+        version += [
+            str(request.user.pk),
+            request.session.session_key or "",
+            str(watched_listings(request.user)["version"]),
+        ]
+    return quote_etag(hashlib.md5("|".join(version).encode()).hexdigest())
+
+
+def conditional_response(request, view, marker, *args, **kwargs):
+    version = marker(request, *args, **kwargs)
+    if version is None:
+        return view(request, *args, **kwargs)
+    last_modified, parts = version
+    etag = page_etag(request, last_modified, parts)
+    anonymous = not request.user.is_authenticated
+    timestamp = int(last_modified.timestamp()) if anonymous else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is None:
+        response = view(request, *args, **kwargs)
+        if response.status_code != 200:
+            return response
+    response.headers.setdefault("ETag", etag)
+    if anonymous:
+        response.headers.setdefault("Last-Modified", http_date(timestamp))
+        patch_cache_control(response, public=True, max_age=settings.PAGE_CACHE_MAX_AGE)
+    else:
+        patch_cache_control(response, private=True, no_cache=True)
+    # the session and CSRF cookies decide which version of the page is served
+    patch_vary_headers(response, ("Cookie",))
+    return response
+
+
+def conditional_page(marker):
+    """Answer GET/HEAD with 304 Not Modified when the marker says nothing changed.
+
+    Anonymous pages are the same for everyone, they get Last-Modified and a short
+    public max-age so a shared cache can hold them. Signed in pages only get a
+    private ETag and must be revalidated on every use.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            # a message left by a write command must be rendered, never answered with 304
+            if request.method not in ("GET", "HEAD") or len(get_messages(request)):
+                return view(request, *args, **kwargs)
+            # the marker and the page are read from the request's one alias, so a
+            # lagging replica labels its content with its own, older version
+            return conditional_response(request, view, marker, *args, **kwargs)
+        return wrapper
+    return decorator
+# ---- end conditional responses ----
@@ -0,0 +1,14 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cache import watched_ids
+
+
+def fragment_cache(request):
+    # the {% cache %} tag needs its timeout in the template context
+    return {"fragment_cache_timeout": settings.FRAGMENT_CACHE_TIMEOUT}
+
+
+def watchlist(request):
+    # read from the cache only by templates that show watch state
+    return {"watched_ids": SimpleLazyObject(lambda: watched_ids(request.user))}
@@ -0,0 +1,95 @@
+import asyncio
+import json
+import threading
+from collections import defaultdict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+
+KEEPALIVE_SECONDS = 15
+QUEUE_SIZE = 64
+
+
+class Subscription:
+    def __init__(self, listing_id):
+        self.listing_id = listing_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+
+    def deliver(self, message):
+        # runs on the subscriber's event loop, a slow client loses its oldest events
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+
+class ListingEventBroker:
+    """In-process pub/sub of listing updates.
+
+    Subscribers are asyncio queues living on the ASGI event loop, publishers are
+    the sync views running in worker threads. Only clients connected to the same
+    process see the events.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def subscribe(self, listing_id):
+        subscription = Subscription(listing_id)
+        with self._lock:
+            self._subscriptions[listing_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.listing_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.listing_id]
+
+    def subscriber_count(self, listing_id):
+        with self._lock:
+            return len(self._subscriptions.get(listing_id, ()))
+
+    def publish(self, listing_id, event, data):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(listing_id, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, (event, data))
+            except RuntimeError:
+                # the subscriber's loop is gone, its stream is being torn down
+                self.unsubscribe(subscription)
+
+
+broker = ListingEventBroker()
+
+
+def publish_on_commit(listing_id, event, data):
+    # never announce a bid or comment that could still be rolled back
+    transaction.on_commit(lambda: broker.publish(int(listing_id), event, data))
+
+
+def format_event(event, data):
+    # amounts are Decimal, written as exact strings
+    return f"event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+async def stream_listing_events(subscription, initial):
+    try:
+        yield format_event("bid", initial)
+        while True:
+            try:
+                event, data = await asyncio.wait_for(
+                    subscription.queue.get(), timeout=KEEPALIVE_SECONDS
+                )
+            except asyncio.TimeoutError:
+                # keep proxies from closing an idle stream
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(event, data)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,93 @@
+import heapq
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+# per time bucket: a counter per listing, and the listings numbered 1..size in the
+# order they got their first bid of the bucket, so the window can be read back
+HOT_COUNT_KEY = "auctions:hot:{}:count:{}"
+HOT_SIZE_KEY = "auctions:hot:{}:size"
+HOT_SLOT_KEY = "auctions:hot:{}:slot:{}"
+# the last ranking computed from the window, per limit
+HOT_RANKING_KEY = "auctions:hot:ranking:{}"
+
+
+def hot_cache():
+    # LocMem by default, so every process ranks its own bids; point the alias at a
+    # shared backend to rank across processes
+    return caches[getattr(settings, "HOT_LISTINGS_CACHE_ALIAS", "hot_listings")]
+
+
+def _bucket(now):
+    return int(now // settings.HOT_LISTINGS_BUCKET_SECONDS)
+
+
+def _increment(cache, key, timeout):
+    # add() and incr() are atomic in the shared backends, concurrent bids from
+    # several processes are all counted
+    if cache.add(key, 1, timeout):
+        return 1
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # expired between add() and incr()
+        cache.add(key, 1, timeout)
+        return 1
+
+
+def record_bid(listing_id, now=None):
+    """Count one bid in the current bucket, called once per committed bid."""
+    bucket = _bucket(time.time() if now is None else now)
+    # a bucket lives as long as the window that can still see it
+    timeout = settings.HOT_LISTINGS_BUCKET_SECONDS * (settings.HOT_LISTINGS_WINDOW_BUCKETS + 1)
+    cache = hot_cache()
+    if _increment(cache, HOT_COUNT_KEY.format(bucket, listing_id), timeout) == 1:
+        # the listing's first bid in this bucket takes the next slot
+        slot = _increment(cache, HOT_SIZE_KEY.format(bucket), timeout)
+        cache.set(HOT_SLOT_KEY.format(bucket, slot), listing_id, timeout)
+
+
+def hot_listing_ids(limit=None, now=None):
+    """Ids of the listings with the most bids over the sliding window, busiest first.
+
+    The ranking is kept for HOT_LISTINGS_RANKING_SECONDS, one cache read per call
+    until then. Working it out takes three get_many calls (slot counts, slots,
+    counters) over every listing bid on in the window, no database query.
+    """
+    limit = settings.HOT_LISTINGS_SIZE if limit is None else limit
+    if now is not None:
+        return _rank(limit, now)
+    cache = hot_cache()
+    key = HOT_RANKING_KEY.format(limit)
+    ranking = cache.get(key)
+    if ranking is None:
+        ranking = _rank(limit, time.time())
+        cache.set(key, ranking, getattr(settings, "HOT_LISTINGS_RANKING_SECONDS", 5))
+    return ranking
+
+
+def _rank(limit, now):
+    current = _bucket(now)
+    window = range(current - settings.HOT_LISTINGS_WINDOW_BUCKETS + 1, current + 1)
+    cache = hot_cache()
+    sizes = cache.get_many([HOT_SIZE_KEY.format(bucket) for bucket in window])
+    slots = cache.get_many([
+        HOT_SLOT_KEY.format(bucket, slot)
+        for bucket in window
+        for slot in range(1, sizes.get(HOT_SIZE_KEY.format(bucket), 0) + 1)
+    ])
+    counters = {}
+    for bucket in window:
+        for slot in range(1, sizes.get(HOT_SIZE_KEY.format(bucket), 0) + 1):
+            listing_id = slots.get(HOT_SLOT_KEY.format(bucket, slot))
+            if listing_id is not None:
+                counters[HOT_COUNT_KEY.format(bucket, listing_id)] = listing_id
+    totals = Counter()
+    for key, count in cache.get_many(list(counters)).items():
+        totals[counters[key]] += count
+    # ties go to the newer listing
+    busiest = heapq.nlargest(limit, totals.items(), key=lambda item: (item[1], item[0]))
+    return [listing_id for listing_id, _ in busiest]
@@ -0,0 +1,64 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand
+from django.template.loader import render_to_string
+from django.test import RequestFactory
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from auctions.benchmark import generate_data
+from auctions.cache import fragment_cache
+from auctions.models import Category, Listing
+from auctions.pagination import keyset_paginate
+from auctions.views import listing_cards
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the render time of a large listing grid with and without the cached "
+        "card and category fragments, on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--cards", type=int, default=500)
+        parser.add_argument("--renders", type=int, default=50)
+
+    def handle(self, *args, **options):
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            generate_data(listings=options["cards"], bids=1, comments=0)
+            results = self.run(options["cards"], options["renders"])
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+        for label, seconds in results.items():
+            self.stdout.write(f"{label:>9}: {seconds * 1000:8.2f} ms per {options['cards']}-card page")
+        self.stdout.write(self.style.SUCCESS(
+            f"speedup: {results['uncached'] / results['cached']:.2f}x"
+        ))
+
+    def run(self, cards, renders):
+        request = RequestFactory().get("/")
+        request.user = AnonymousUser()
+        # the page is loaded once, only template rendering is timed
+        page = keyset_paginate(listing_cards(Listing.objects.filter(is_active=True)), page_size=cards)
+        dummy = {"BACKEND": "django.core.cache.backends.dummy.DummyCache"}
+        results = {}
+        for label, caches in (
+            ("uncached", {**settings.CACHES, "template_fragments": dummy}),
+            ("cached", settings.CACHES),
+        ):
+            with override_settings(CACHES=caches):
+                fragment_cache().clear()
+                context = {"actives": page, "categories": list(Category.objects.all())}
+                render_to_string("auctions/index.html", context, request)
+                started = time.perf_counter()
+                for _ in range(renders):
+                    render_to_string("auctions/index.html", context, request)
+                results[label] = (time.perf_counter() - started) / renders
+        return results
@@ -0,0 +1,47 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from auctions.cache import cache_stats, listing_cache, reset_cache_stats, LISTING_KEY
+from auctions.models import Listing
+
+
+class Command(BaseCommand):
+    help = "Compare requests/sec on a hot listing page with and without the listing cache."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listing", type=int, help="listing id, defaults to the newest listing")
+        parser.add_argument("--requests", type=int, default=500)
+
+    def handle(self, *args, **options):
+        listing_id = options["listing"] or Listing.objects.order_by("-id").values_list("id", flat=True).first()
+        if listing_id is None:
+            raise CommandError("There are no listings to benchmark.")
+        url = reverse("listing", args=(listing_id,))
+        client = Client(HTTP_HOST="localhost")
+
+        results = {}
+        for label, enabled in (("uncached", False), ("cached", True)):
+            listing_cache().delete(LISTING_KEY.format(listing_id))
+            reset_cache_stats()
+            with override_settings(LISTING_CACHE_ENABLED=enabled):
+                client.get(url)
+                started = time.perf_counter()
+                for _ in range(options["requests"]):
+                    response = client.get(url)
+                    if response.status_code != 200:
+                        raise CommandError(f"{url} answered {response.status_code}")
+                elapsed = time.perf_counter() - started
+            results[label] = options["requests"] / elapsed
+            stats = cache_stats()
+            self.stdout.write(
+                f"{label:>8}: {results[label]:8.1f} req/s "
+                f"(hits={stats['hits']} misses={stats['misses']})"
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"speedup: {results['cached'] / results['uncached']:.2f}x on {url}"
+        ))
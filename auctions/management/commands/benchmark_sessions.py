@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+from django.test.runner import DiscoverRunner
+
+from auctions.benchmark import compare_session_backends, generate_data
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare queries and latency per signed-in request with database sessions and "
+        "with cached_db sessions plus the cached user, on a throwaway database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--listings", type=int, default=1000)
+        parser.add_argument("--requests", type=int, default=200, help="requests per view")
+        parser.add_argument("--view", action="append", dest="views", help="views to compare")
+
+    def handle(self, *args, **options):
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            generate_data(listings=options["listings"])
+            results = compare_session_backends(
+                requests=options["requests"], views=options["views"] or ("index", "listing_by_id")
+            )
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+        for view in results["db"]:
+            before, after = results["db"][view], results["cached_db"][view]
+            self.stdout.write(
+                f"{view:>14}: {before['queries_per_request']:5.2f} -> {after['queries_per_request']:5.2f} "
+                f"queries/request, p50 {before['p50_ms']:.2f}ms -> {after['p50_ms']:.2f}ms"
+            )
@@ -0,0 +1,123 @@
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from auctions.sqlite import apply_pragmas
+
+
+SCHEMA = [
+    "CREATE TABLE listing (id INTEGER PRIMARY KEY, title TEXT, bid_current INTEGER)",
+    "CREATE TABLE bid (id INTEGER PRIMARY KEY, listing_id INTEGER, amount INTEGER)",
+    "CREATE INDEX bid_listing ON bid (listing_id, id)",
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare concurrent read/write throughput of a scratch SQLite database "
+        "with default settings and with SQLITE_PRAGMAS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--seconds", type=float, default=3)
+        parser.add_argument("--readers", type=int, default=4)
+        parser.add_argument("--writers", type=int, default=4)
+        parser.add_argument("--listings", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        tuned_timeout = settings.DATABASES["default"].get("OPTIONS", {}).get("timeout", 5)
+        configurations = (
+            # bare sqlite3 settings: rollback journal and Python's 5s lock timeout
+            ("default", {}, 5),
+            ("tuned", getattr(settings, "SQLITE_PRAGMAS", {}), tuned_timeout),
+        )
+        for label, pragmas, timeout in configurations:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "bench.sqlite3")
+                self.prepare(path, pragmas, options["listings"])
+                result = self.run(path, pragmas, timeout, options)
+            self.stdout.write(
+                f"{label:>8}: {result['reads'] / options['seconds']:9.0f} reads/s "
+                f"{result['writes'] / options['seconds']:7.0f} bids/s "
+                f"{result['locked']:5d} locked errors"
+            )
+
+    def connect(self, path, pragmas, timeout):
+        connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        apply_pragmas(connection, pragmas)
+        return connection
+
+    def prepare(self, path, pragmas, listings):
+        connection = self.connect(path, pragmas, 5)
+        for statement in SCHEMA:
+            connection.execute(statement)
+        connection.executemany(
+            "INSERT INTO listing (title, bid_current) VALUES (?, 0)",
+            ((f"Listing {n}",) for n in range(listings)),
+        )
+        connection.close()
+
+    def run(self, path, pragmas, timeout, options):
+        counters = {"reads": 0, "writes": 0, "locked": 0}
+        lock = threading.Lock()
+        deadline = time.perf_counter() + options["seconds"]
+        listings = options["listings"]
+
+        def count(name):
+            with lock:
+                counters[name] += 1
+
+        def reader(seed):
+            connection = self.connect(path, pragmas, timeout)
+            listing_id = seed
+            while time.perf_counter() < deadline:
+                listing_id = listing_id % listings + 1
+                try:
+                    connection.execute("SELECT * FROM listing WHERE id = ?", (listing_id,)).fetchall()
+                    connection.execute(
+                        "SELECT * FROM bid WHERE listing_id = ? ORDER BY id DESC LIMIT 1", (listing_id,)
+                    ).fetchall()
+                except sqlite3.OperationalError:
+                    count("locked")
+                    continue
+                count("reads")
+            connection.close()
+
+        def writer(seed):
+            # the same shape as place_bid: conditional update plus insert in one transaction
+            connection = self.connect(path, pragmas, timeout)
+            listing_id = seed
+            amount = 0
+            while time.perf_counter() < deadline:
+                listing_id = listing_id % listings + 1
+                amount += 1
+                try:
+                    connection.execute("BEGIN IMMEDIATE")
+                    connection.execute(
+                        "UPDATE listing SET bid_current = ? WHERE id = ? AND bid_current < ?",
+                        (amount, listing_id, amount),
+                    )
+                    connection.execute(
+                        "INSERT INTO bid (listing_id, amount) VALUES (?, ?)", (listing_id, amount)
+                    )
+                    connection.execute("COMMIT")
+                except sqlite3.OperationalError:
+                    if connection.in_transaction:
+                        connection.execute("ROLLBACK")
+                    count("locked")
+                    continue
+                count("writes")
+            connection.close()
+
+        threads = [threading.Thread(target=reader, args=(n,)) for n in range(options["readers"])]
+        threads += [threading.Thread(target=writer, args=(n,)) for n in range(options["writers"])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return counters
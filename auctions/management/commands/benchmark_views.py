@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.runner import DiscoverRunner
+
+from auctions.benchmark import compare_to_baseline, generate_data, run_benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the auctions views against a throwaway database filled with synthetic data "
+        "and report latency percentiles, queries per request and throughput as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=50)
+        parser.add_argument("--categories", type=int, default=10)
+        parser.add_argument("--listings", type=int, default=1000)
+        parser.add_argument("--bids", type=int, default=5, help="bids per listing")
+        parser.add_argument("--comments", type=int, default=3, help="comments per listing")
+        parser.add_argument("--requests", type=int, default=200, help="requests per view")
+        parser.add_argument("--view", action="append", dest="views", help="only benchmark these views")
+        parser.add_argument("--output", help="write the results to this JSON file")
+        parser.add_argument("--baseline", help="JSON results to compare against")
+        parser.add_argument("--tolerance", type=float, default=0.25, help="allowed p95 slowdown")
+
+    def handle(self, *args, **options):
+        # the benchmark never touches the real database, it builds a test one like the test runner
+        runner = DiscoverRunner(verbosity=0, interactive=False)
+        runner.setup_test_environment()
+        databases = runner.setup_databases()
+        try:
+            generate_data(
+                users=options["users"],
+                categories=options["categories"],
+                listings=options["listings"],
+                bids=options["bids"],
+                comments=options["comments"],
+            )
+            results = run_benchmarks(requests=options["requests"], only=options["views"])
+        finally:
+            runner.teardown_databases(databases)
+            runner.teardown_test_environment()
+
+        report = json.dumps(results, indent=2, sort_keys=True)
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                output.write(report + "\n")
+        self.stdout.write(report)
+
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                regressions = compare_to_baseline(results, json.load(baseline), options["tolerance"])
+            if regressions:
+                raise CommandError("Performance regressions:\n" + "\n".join(regressions))
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline."))
@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.services import CLOSE_BATCH_SIZE, close_expired_auctions
+
+
+class Command(BaseCommand):
+    help = "Close every auction whose end time has passed, optionally in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=CLOSE_BATCH_SIZE)
+        parser.add_argument(
+            "--loop", action="store_true", help="keep running, closing auctions every --interval seconds"
+        )
+        parser.add_argument("--interval", type=float, default=30)
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            closed = close_expired_auctions(batch_size=options["batch_size"])
+            if closed or not options["loop"]:
+                self.stdout.write(
+                    f"Closed {closed} expired auctions in {time.perf_counter() - started:.2f}s"
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
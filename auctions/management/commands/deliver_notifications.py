@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from auctions.notifications import DRAIN_BATCH_SIZE, WATCHER_CHUNK_SIZE, drain_outbox, get_sink
+
+
+class Command(BaseCommand):
+    help = "Tell watchers about new bids and closed auctions from the outbox, optionally in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=DRAIN_BATCH_SIZE, help="outbox events per batch")
+        parser.add_argument("--chunk-size", type=int, default=WATCHER_CHUNK_SIZE, help="watchers per query")
+        parser.add_argument("--sink", help="dotted path of the sink class, defaults to NOTIFICATION_SINK")
+        parser.add_argument(
+            "--loop", action="store_true", help="keep running, draining the outbox every --interval seconds"
+        )
+        parser.add_argument("--interval", type=float, default=5)
+
+    def handle(self, *args, **options):
+        sink = get_sink(options["sink"])
+        while True:
+            started = time.perf_counter()
+            events, sent = drain_outbox(sink, batch_size=options["batch_size"], chunk_size=options["chunk_size"])
+            if events or not options["loop"]:
+                self.stdout.write(
+                    f"Delivered {sent} notifications for {events} events "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
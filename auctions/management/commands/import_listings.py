@@ -0,0 +1,138 @@
+import csv
+import io
+import json
+import sys
+import time
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.models import Category, Listing, User
+from auctions.money import parse_amount
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_csv(stream):
+    for line_number, row in enumerate(csv.DictReader(stream), start=2):
+        yield line_number, row
+
+
+def read_jsonl(stream):
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as error:
+            yield line_number, RowError(f"invalid JSON: {error}")
+            continue
+        yield line_number, row
+
+
+READERS = {"csv": read_csv, "jsonl": read_jsonl}
+
+
+def text(row, name):
+    # JSONL values can be of any type, text fields must be strings
+    value = row.get(name)
+    if value is None:
+        return ""
+    if not isinstance(value, str):
+        raise RowError(f"{name} must be text, got {value!r}")
+    return value
+
+
+class Command(BaseCommand):
+    help = "Import listings in bulk from a CSV or JSONL file (or stdin)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", nargs="?", default="-", help="file to import, - for stdin")
+        parser.add_argument("--format", choices=sorted(READERS), help="defaults to the file extension")
+        parser.add_argument("--seller", help="username the imported listings belong to")
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        data_format = options["format"] or ("jsonl" if path.endswith((".jsonl", ".json")) else "csv")
+        seller = None
+        if options["seller"]:
+            try:
+                seller = User.objects.get(username=options["seller"])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown seller {options['seller']!r}.")
+        # every category slug is resolved from this one lookup
+        self.categories = dict(Category.objects.values_list("slug", "id"))
+        self.seller = seller
+
+        if path == "-":
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+            self.run(stream, data_format, options["batch_size"])
+        else:
+            with open(path, encoding="utf-8", newline="") as stream:
+                self.run(stream, data_format, options["batch_size"])
+
+    def run(self, stream, data_format, batch_size):
+        started = time.perf_counter()
+        listings = self.listings(READERS[data_format](stream))
+        imported = 0
+        # only one batch of listings is held in memory at a time
+        while True:
+            batch = list(islice(listings, batch_size))
+            if not batch:
+                break
+            # bulk_create writes the batch in a single INSERT inside its own transaction
+            Listing.objects.bulk_create(batch, batch_size=batch_size)
+            imported += len(batch)
+
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {imported} listings in {elapsed:.2f}s "
+            f"({imported / elapsed if elapsed else 0:.0f} rows/s), {self.errors} error rows"
+        ))
+
+    def listings(self, rows):
+        self.errors = 0
+        for line_number, row in rows:
+            try:
+                if isinstance(row, RowError):
+                    raise row
+                yield self.build_listing(row)
+            except RowError as error:
+                self.errors += 1
+                self.stderr.write(f"line {line_number}: {error}")
+            except (TypeError, AttributeError) as error:
+                # a malformed row is an error row, it never aborts the rest of the import
+                self.errors += 1
+                self.stderr.write(f"line {line_number}: invalid row: {error}")
+
+    def build_listing(self, row):
+        if not isinstance(row, dict):
+            raise RowError("expected an object")
+        title = text(row, "title").strip()
+        if not title:
+            raise RowError("missing title")
+        description = text(row, "description")
+        if len(title) > 100 or len(description) > 500:
+            raise RowError("title or description too long")
+        try:
+            price = parse_amount(row.get("price") or 0)
+        except ValueError:
+            raise RowError(f"invalid price {row.get('price')!r}")
+        slug = text(row, "category").strip()
+        if slug and slug not in self.categories:
+            raise RowError(f"unknown category {slug!r}")
+        is_active = row.get("is_active", True)
+        if isinstance(is_active, str):
+            is_active = is_active.strip().lower() not in ("0", "false", "no", "off")
+        return Listing(
+            title=title,
+            description=description,
+            image_url=text(row, "image_url"),
+            bid_current=price,
+            is_active=bool(is_active),
+            seller=self.seller,
+            category_id=self.categories.get(slug),
+        )
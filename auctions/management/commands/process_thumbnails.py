@@ -0,0 +1,42 @@
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management.base import BaseCommand, CommandError
+
+from auctions.thumbnails import process_pending, retry_failed
+
+
+class Command(BaseCommand):
+    help = "Turn uploaded and linked listing images into card and large thumbnails, optionally in a loop."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=4, help="image processes, 0 to work inline")
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--limit", type=int, help="stop after this many listings")
+        parser.add_argument(
+            "--loop", action="store_true", help="keep running, picking up new listings every --interval seconds"
+        )
+        parser.add_argument("--interval", type=float, default=10)
+        parser.add_argument(
+            "--retry-failed", action="store_true", help="queue the listings that failed before again"
+        )
+
+    def handle(self, *args, **options):
+        if options["retry_failed"]:
+            self.stdout.write(f"Retrying {retry_failed()} failed listings")
+        while True:
+            started = time.perf_counter()
+            try:
+                processed, failed = process_pending(
+                    workers=options["workers"], batch_size=options["batch_size"], limit=options["limit"]
+                )
+            except ImproperlyConfigured as error:
+                raise CommandError(str(error))
+            if processed or failed or not options["loop"]:
+                self.stdout.write(
+                    f"Made thumbnails for {processed} listings ({failed} failed) "
+                    f"in {time.perf_counter() - started:.2f}s"
+                )
+            if not options["loop"]:
+                return
+            time.sleep(options["interval"])
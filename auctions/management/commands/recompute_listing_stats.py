@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+
+from auctions.models import Listing
+from auctions.services import recompute_listing_stats
+
+
+class Command(BaseCommand):
+    help = "Recompute the denormalized bid count, leading bidder and comment count of every listing."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        last_id = Listing.objects.aggregate(last=Max("id"))["last"] or 0
+        started = time.perf_counter()
+        updated = 0
+        # one UPDATE per id range keeps each write transaction short
+        for start in range(0, last_id, batch_size):
+            with transaction.atomic():
+                updated += recompute_listing_stats(
+                    Listing.objects.filter(id__gt=start, id__lte=start + batch_size)
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed stats of {updated} listings in {time.perf_counter() - started:.2f}s"
+        ))
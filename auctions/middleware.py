@@ -0,0 +1,67 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from .timing import RequestTiming, current_timing
+
+
+logger = logging.getLogger("auctions.timing")
+
+
+class RequestTimingMiddleware:
+    """Per-request wall, DB and template time, as Server-Timing headers and log lines.
+
+    Opt in with REQUEST_TIMING_ENABLED, requests over REQUEST_TIMING_QUERY_BUDGET
+    queries or REQUEST_TIMING_MS_BUDGET milliseconds are logged as warnings.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, "REQUEST_TIMING_ENABLED", False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.query_budget = getattr(settings, "REQUEST_TIMING_QUERY_BUDGET", 10)
+        self.ms_budget = getattr(settings, "REQUEST_TIMING_MS_BUDGET", 200)
+        self.slow_queries = getattr(settings, "REQUEST_TIMING_SLOW_QUERIES", 3)
+
+    def __call__(self, request):
+        timing = RequestTiming(self.slow_queries)
+        token = current_timing.set(timing)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timing.record_query))
+                response = self.get_response(request)
+        finally:
+            current_timing.reset(token)
+        total_ms = (time.perf_counter() - started) * 1000
+        db_ms = timing.db_seconds * 1000
+        template_ms = timing.template_seconds * 1000
+
+        response["Server-Timing"] = ", ".join([
+            f"total;dur={total_ms:.1f}",
+            f'db;dur={db_ms:.1f};desc="{timing.query_count} queries"',
+            f"tpl;dur={template_ms:.1f}",
+        ])
+
+        over_budget = timing.query_count > self.query_budget or total_ms > self.ms_budget
+        match = request.resolver_match
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(total_ms, 1),
+            "db_ms": round(db_ms, 1),
+            "queries": timing.query_count,
+            "template_ms": round(template_ms, 1),
+            "over_budget": over_budget,
+            "slowest_queries": timing.slowest(),
+        }
+        logger.log(logging.WARNING if over_budget else logging.INFO, json.dumps(record))
+        return response
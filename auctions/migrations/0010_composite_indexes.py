@@ -0,0 +1,46 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:04
+
+from django.db import migrations, models
+from django.db.models import Min
+
+
+def remove_duplicate_watchlist_entries(apps, schema_editor):
+    # keep the oldest entry of every (user, listing) pair so the unique constraint can be added
+    UserWatchlist = apps.get_model('auctions', 'UserWatchlist')
+    keep = (
+        UserWatchlist.objects.values('user', 'listing')
+        .annotate(first_id=Min('id'))
+        .values('first_id')
+    )
+    UserWatchlist.objects.exclude(id__in=keep).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0009_remove_listing_bid_start_alter_listing_title'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['listing', 'id'], name='bid_listing_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bid',
+            index=models.Index(fields=['bidder', 'listing'], name='bid_bidder_listing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['id'], name='listing_active_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['category', 'id'], name='listing_active_category_idx'),
+        ),
+        migrations.RunPython(remove_duplicate_watchlist_entries, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='userwatchlist',
+            constraint=models.UniqueConstraint(fields=('user', 'listing'), name='unique_user_watchlist_listing'),
+        ),
+    ]
@@ -0,0 +1,56 @@
+# Generated by Django 5.0.14 on 2026-10-18 19:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_listing_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+    Comment = apps.get_model('auctions', 'Comment')
+
+    def count_of(model):
+        counted = (
+            model.objects.filter(listing=OuterRef('pk'))
+            .order_by()
+            .values('listing')
+            .annotate(total=Count('id'))
+            .values('total')
+        )
+        return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+    top_bid = Bid.objects.filter(listing=OuterRef('pk')).order_by('-amount', '-id')
+    Listing.objects.update(
+        bid_count=count_of(Bid),
+        comment_count=count_of(Comment),
+        high_bidder=Subquery(top_bid.values('bidder')[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0011_listing_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='bid_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='high_bidder',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_listing_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:40
+
+import auctions.money
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # step 1 of 3: integer cents columns next to the float ones
+
+    dependencies = [
+        ('auctions', '0015_listing_thumbnails'),
+    ]
+
+    operations = [
+        # only so that 0018 can be reversed, the float column comes back filled with 0
+        migrations.AlterField(
+            model_name='bid',
+            name='amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='bid_current_cents',
+            field=auctions.money.CentsField(default=0),
+        ),
+        migrations.AddField(
+            model_name='bid',
+            name='amount_cents',
+            field=auctions.money.CentsField(default=0),
+        ),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, transaction
+from django.db.models import F, Max
+from django.db.models.functions import Round
+
+
+BATCH_SIZE = 5000
+# (model, float column, cents column)
+COLUMNS = (
+    ("Listing", "bid_current", "bid_current_cents"),
+    ("Bid", "amount", "amount_cents"),
+)
+
+
+def copy_in_batches(apps, schema_editor, convert):
+    alias = schema_editor.connection.alias
+    for model_name, source, target in COLUMNS:
+        model = apps.get_model("auctions", model_name)
+        rows = model.objects.using(alias)
+        last_id = rows.aggregate(last=Max("id"))["last"] or 0
+        # one short transaction per id range, writers are never locked out for long
+        for start in range(0, last_id, BATCH_SIZE):
+            with transaction.atomic(using=alias):
+                rows.filter(id__gt=start, id__lte=start + BATCH_SIZE).update(**convert(source, target))
+
+
+def to_cents(apps, schema_editor):
+    copy_in_batches(apps, schema_editor, lambda source, target: {target: Round(F(source) * 100)})
+
+
+def to_float(apps, schema_editor):
+    copy_in_batches(apps, schema_editor, lambda source, target: {source: F(target) / 100.0})
+
+
+class Migration(migrations.Migration):
+    # step 2 of 3: copy the amounts, outside a migration-wide transaction
+    atomic = False
+
+    dependencies = [
+        ('auctions', '0016_amount_cents_columns'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_cents, to_float),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.0.14 on 2026-10-18 22:41
+
+import auctions.money
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # step 3 of 3: the cents columns take over the float columns' names
+
+    dependencies = [
+        ('auctions', '0017_copy_amounts_to_cents'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='listing',
+            name='bid_current',
+        ),
+        migrations.RemoveField(
+            model_name='bid',
+            name='amount',
+        ),
+        migrations.RenameField(
+            model_name='listing',
+            old_name='bid_current_cents',
+            new_name='bid_current',
+        ),
+        migrations.RenameField(
+            model_name='bid',
+            old_name='amount_cents',
+            new_name='amount',
+        ),
+        migrations.AlterField(
+            model_name='bid',
+            name='amount',
+            field=auctions.money.CentsField(),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-bid_current', '-id'], name='listing_active_price_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0.14 on 2026-10-18 23:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0018_amounts_in_cents'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['listing', 'id'], name='comment_listing_id_idx'),
+        ),
+    ]
@@ -1,8 +1,11 @@
 from typing import Any
 from django.contrib.auth.models import AbstractUser
+from django.core.files.storage import default_storage
 from django.db import models
 from django.utils.text import slugify
 
+from .money import CentsField
+
 
 class User(AbstractUser):
     pass
@@ -11,6 +14,13 @@ class User(AbstractUser):
 class Category(models.Model):
     name = models.CharField(max_length=64)
     slug = models.SlugField(unique=True, max_length=100, blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # freshness marker of the category dropdown
+            models.Index(fields=["updated_at"], name="category_updated_at_idx"),
+        ]
 
     def save(self, *args, **kwargs):
         # generate a slug
@@ -26,7 +36,8 @@ class Listing(models.Model):
     title = models.CharField(max_length=100)
     description = models.CharField(max_length=500)
     image_url = models.CharField(max_length=1000)
-    bid_current = models.FloatField(default=0)
+    # money is kept in integer cents, see CentsField
+    bid_current = CentsField(default=0)
     is_active = models.BooleanField(default=True)
     seller = models.ForeignKey(
         User, on_delete=models.CASCADE, blank=True, null=True, related_name="seller"
@@ -38,6 +49,69 @@ class Listing(models.Model):
         null=True,
         related_name="category"
     )
+    # denormalized stats, written in the same transaction as the bid or comment
+    bid_count = models.PositiveIntegerField(default=0)
+    high_bidder = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        related_name="leading_listings"
+    )
+    comment_count = models.PositiveIntegerField(default=0)
+    # auctions without an end time stay open until the seller closes them
+    ends_at = models.DateTimeField(blank=True, null=True)
+    # bumped by every bid, comment and close, drives ETag/Last-Modified
+    updated_at = models.DateTimeField(auto_now=True)
+    # storage names written by the thumbnail pipeline, image_url is the fallback
+    image_source = models.CharField(max_length=255, blank=True)
+    thumbnail = models.CharField(max_length=255, blank=True)
+    image_large = models.CharField(max_length=255, blank=True)
+    thumbnail_failed = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            # active listings page, walked in id order
+            models.Index(
+                fields=["id"], condition=models.Q(is_active=True), name="listing_active_id_idx"
+            ),
+            # active listings of a category, walked in id order
+            models.Index(
+                fields=["category", "id"],
+                condition=models.Q(is_active=True),
+                name="listing_active_category_idx",
+            ),
+            # top active listings by current price, read straight off the index
+            models.Index(
+                fields=["-bid_current", "-id"],
+                condition=models.Q(is_active=True),
+                name="listing_active_price_idx",
+            ),
+            # listings waiting for the thumbnail workers
+            models.Index(
+                fields=["id"],
+                name="listing_thumbnail_pending_idx",
+                condition=models.Q(thumbnail="", thumbnail_failed=False),
+            ),
+            # freshness markers of the listing grids
+            models.Index(fields=["updated_at"], name="listing_updated_at_idx"),
+            models.Index(fields=["category", "updated_at"], name="listing_category_updated_idx"),
+            # expired auctions still open, found by the expiry scheduler
+            models.Index(
+                fields=["ends_at"],
+                condition=models.Q(is_active=True),
+                name="listing_active_ends_at_idx",
+            ),
+        ]
+
+    @property
+    def card_image_url(self):
+        # grids show the small thumbnail once the workers have made one
+        return default_storage.url(self.thumbnail) if self.thumbnail else self.image_url
+
+    @property
+    def detail_image_url(self):
+        return default_storage.url(self.image_large) if self.image_large else self.image_url
 
     def __str__(self):
         return self.title
@@ -48,6 +122,12 @@ class Comment(models.Model):
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
     message = models.CharField(max_length=300)
 
+    class Meta:
+        indexes = [
+            # a listing's comments, paged newest first
+            models.Index(fields=["listing", "id"], name="comment_listing_id_idx"),
+        ]
+
     def __str__(self):
         return f"{self.author} comment on {self.listing}"
 
@@ -55,7 +135,15 @@ class Comment(models.Model):
 class Bid(models.Model):
     bidder = models.ForeignKey(User, on_delete=models.CASCADE)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
-    amount = models.FloatField()
+    amount = CentsField()
+
+    class Meta:
+        indexes = [
+            # latest bid of a listing
+            models.Index(fields=["listing", "id"], name="bid_listing_id_idx"),
+            # has this user bid on the listing
+            models.Index(fields=["bidder", "listing"], name="bid_bidder_listing_idx"),
+        ]
 
     def __str__(self):
         return f"{self.bidder.username} bids ${self.amount} on {self.listing.title}"
@@ -65,5 +153,32 @@ class UserWatchlist(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     listing = models.ForeignKey(Listing, on_delete=models.CASCADE)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "listing"], name="unique_user_watchlist_listing"),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username}'s watchlist entry for {self.listing.title}"
+
+
+class OutboxEvent(models.Model):
+    """A listing change still to be announced to its watchers.
+
+    Written in the same transaction as the change, so an event exists exactly when
+    the change was committed. The deliver_notifications worker drains the table.
+    """
+
+    BID = "bid"
+    CLOSED = "closed"
+    KIND_CHOICES = [(BID, "Bid"), (CLOSED, "Closed")]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    listing = models.ForeignKey(Listing, on_delete=models.CASCADE, related_name="+")
+    # the bidder, who is not told about their own bid
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, null=True, related_name="+")
+    amount = CentsField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
     def __str__(self):
-        return f"{self.user.username}'s watchlist entry for {self.listing.title}"
\ No newline at end of file
+        return f"{self.kind} on listing {self.listing_id}"
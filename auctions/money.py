@@ -0,0 +1,79 @@
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import models
+from django.db.models.lookups import GreaterThanOrEqual, LessThan
+
+
+# amounts are stored in cents, two decimal places on the Decimal side
+MINOR_UNITS = 100
+CENT = Decimal("0.01")
+# keeps the cents well inside a 64-bit integer
+MAX_AMOUNT = Decimal(10 ** 15)
+
+
+def to_decimal(value):
+    # floats go through str() so 10.1 stays 10.1 and not 10.0999999...
+    if isinstance(value, float):
+        value = str(value)
+    try:
+        amount = Decimal(value)
+    except (InvalidOperation, TypeError, ValueError):
+        raise ValueError(f"{value!r} is not an amount.")
+    if not amount.is_finite():
+        raise ValueError(f"{value!r} is not an amount.")
+    return amount.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_cents(value):
+    return int(to_decimal(value) * MINOR_UNITS)
+
+
+def from_cents(cents):
+    return (Decimal(cents) / MINOR_UNITS).quantize(CENT)
+
+
+def parse_amount(value):
+    """Read an amount typed by a user: zero or more, with at most two decimals."""
+    try:
+        amount = Decimal(str(value).strip())
+        exact = amount.is_finite() and amount == amount.quantize(CENT)
+    except InvalidOperation:
+        exact = False
+    if not exact or not 0 <= amount <= MAX_AMOUNT:
+        raise ValueError(f"{value!r} is not an amount.")
+    return amount.quantize(CENT)
+
+
+class CentsField(models.BigIntegerField):
+    """Money stored as integer cents, read and written as Decimal.
+
+    Comparisons and ORDER BY run on plain integers, so they are exact and indexable.
+    """
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else from_cents(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, Decimal):
+            return value
+        try:
+            return to_decimal(value)
+        except ValueError:
+            raise ValidationError(f"{value!r} is not an amount.", code="invalid")
+
+    def get_prep_value(self, value):
+        if value is None or hasattr(value, "resolve_expression"):
+            return value
+        return to_cents(value)
+
+    def formfield(self, **kwargs):
+        # skip IntegerField.formfield, the form edits the Decimal
+        return models.Field.formfield(self, form_class=forms.DecimalField, decimal_places=2, **kwargs)
+
+
+# IntegerField rounds float arguments of these two up to the next integer, amounts
+# are converted to cents by get_prep_value instead
+CentsField.register_lookup(GreaterThanOrEqual)
+CentsField.register_lookup(LessThan)
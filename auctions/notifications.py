@@ -0,0 +1,152 @@
+import json
+from itertools import groupby
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Listing, OutboxEvent, UserWatchlist
+
+
+DRAIN_BATCH_SIZE = 500
+WATCHER_CHUNK_SIZE = 1000
+
+
+# ---- start sinks ----
+# a sink takes a list of notifications, one per user:
+# {"user_id", "username", "email", "updates": [{"listing", "title", "event", "amount", "won"}]}
+class EmailSink:
+    """One email per user through EMAIL_BACKEND (the console backend in development)."""
+
+    def __init__(self):
+        self.connection = get_connection()
+
+    def send(self, notifications):
+        messages = [
+            EmailMessage(subject(notification), body(notification), to=[notification["email"]])
+            for notification in notifications
+            if notification["email"]
+        ]
+        self.connection.send_messages(messages)
+
+
+class FileSink:
+    """Appends each notification as a line of JSON to NOTIFICATION_FILE."""
+
+    def __init__(self, path=None):
+        self.path = path or settings.NOTIFICATION_FILE
+
+    def send(self, notifications):
+        with open(self.path, "a", encoding="utf-8") as output:
+            for notification in notifications:
+                output.write(json.dumps(notification, cls=DjangoJSONEncoder) + "\n")
+
+
+def get_sink(path=None):
+    return import_string(path or settings.NOTIFICATION_SINK)()
+
+
+def describe(update):
+    if update["event"] == OutboxEvent.CLOSED:
+        if update["won"]:
+            return f"You won {update['title']} for ${update['amount']}."
+        return f"{update['title']} closed at ${update['amount']}."
+    return f"{update['title']} has a new high bid of ${update['amount']}."
+
+
+def subject(notification):
+    updates = notification["updates"]
+    if len(updates) == 1:
+        return describe(updates[0])
+    return f"{len(updates)} listings on your watchlist changed"
+
+
+def body(notification):
+    return "\n".join(describe(update) for update in notification["updates"]) + "\n"
+# ---- end sinks ----
+
+
+# ---- start fan-out ----
+def coalesce(events):
+    """The one update per listing worth telling watchers about.
+
+    A closed auction supersedes its bids, and a burst of bids collapses into the
+    latest one: watchers hear about the price it ended at, not every step.
+    """
+    latest = {}
+    for event in events:
+        current = latest.get(event.listing_id)
+        if current is None or current.kind != OutboxEvent.CLOSED:
+            latest[event.listing_id] = event
+    return latest
+
+
+def watchers(listing_ids, chunk_size):
+    # (user, listing) pairs in user order, read chunk by chunk with a keyset on the
+    # unique (user, listing) index, so a user's rows come out together
+    rows = UserWatchlist.objects.filter(listing_id__in=listing_ids).order_by("user_id", "listing_id")
+    after = None
+    while True:
+        chunk = rows
+        if after is not None:
+            chunk = chunk.filter(Q(user_id__gt=after[0]) | Q(user_id=after[0], listing_id__gt=after[1]))
+        chunk = list(chunk.values_list("user_id", "listing_id", "user__username", "user__email")[:chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        after = chunk[-1][:2]
+
+
+def notifications(events, chunk_size=WATCHER_CHUNK_SIZE):
+    """Yield one notification per watcher, covering every listing they watch in ``events``."""
+    latest = coalesce(events)
+    listings = {
+        row["id"]: row
+        for row in Listing.objects.filter(id__in=latest).values("id", "title", "bid_current", "high_bidder_id")
+    }
+    for (user_id, username, email), rows in groupby(
+        watchers(list(listings), chunk_size), key=lambda row: (row[0], row[2], row[3])
+    ):
+        updates = []
+        for _, listing_id, _, _ in rows:
+            event, listing = latest[listing_id], listings[listing_id]
+            if event.kind == OutboxEvent.BID and event.actor_id == user_id:
+                continue
+            updates.append({
+                "listing": listing_id,
+                "title": listing["title"],
+                "event": event.kind,
+                "amount": event.amount if event.kind == OutboxEvent.BID else listing["bid_current"],
+                "won": event.kind == OutboxEvent.CLOSED and listing["high_bidder_id"] == user_id,
+            })
+        if updates:
+            yield {"user_id": user_id, "username": username, "email": email, "updates": updates}
+
+
+def drain_outbox(sink, batch_size=DRAIN_BATCH_SIZE, chunk_size=WATCHER_CHUNK_SIZE):
+    """Deliver pending outbox events in batches, returns (events, notifications).
+
+    Events are deleted once their batch is delivered. A worker stopped mid-batch
+    sends the batch again on the next run, delivery is at least once. Run a single
+    worker at a time.
+    """
+    drained = sent = 0
+    while True:
+        events = list(OutboxEvent.objects.order_by("id")[:batch_size])
+        if not events:
+            return drained, sent
+        pending = []
+        for notification in notifications(events, chunk_size):
+            pending.append(notification)
+            if len(pending) == chunk_size:
+                sink.send(pending)
+                sent += len(pending)
+                pending = []
+        if pending:
+            sink.send(pending)
+            sent += len(pending)
+        OutboxEvent.objects.filter(id__in=[event.id for event in events]).delete()
+        drained += len(events)
+# ---- end fan-out ----
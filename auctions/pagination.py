@@ -0,0 +1,75 @@
+from dataclasses import dataclass, field
+
+
+PAGE_SIZE = 24
+COMMENT_PAGE_SIZE = 20
+
+
+@dataclass
+class KeysetPage:
+    items: list = field(default_factory=list)
+    next_cursor: int = None
+    prev_cursor: int = None
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+    def __bool__(self):
+        return bool(self.items)
+
+
+def parse_cursor(value):
+    # cursors come straight from the query string, ignore anything that is not a positive id
+    try:
+        cursor = int(value)
+    except (TypeError, ValueError):
+        return None
+    return cursor if cursor > 0 else None
+
+
+def keyset_paginate(queryset, after=None, before=None, page_size=PAGE_SIZE,
+                    key="id", descending=False):
+    # seek on an indexed, unique key instead of OFFSET so every page costs the same
+    forward = "-" + key if descending else key
+    backward = key if descending else "-" + key
+    past = key + ("__lt" if descending else "__gt")
+    behind = key + ("__gt" if descending else "__lt")
+
+    if before is not None:
+        rows = list(queryset.filter(**{behind: before}).order_by(backward)[:page_size + 1])
+        has_previous = len(rows) > page_size
+        items = rows[:page_size]
+        items.reverse()
+        has_next = True
+    else:
+        if after is not None:
+            queryset = queryset.filter(**{past: after})
+        rows = list(queryset.order_by(forward)[:page_size + 1])
+        has_next = len(rows) > page_size
+        items = rows[:page_size]
+        has_previous = after is not None
+
+    page = KeysetPage(items=items)
+    if items:
+        if has_next:
+            page.next_cursor = _key_value(items[-1], key)
+        if has_previous:
+            page.prev_cursor = _key_value(items[0], key)
+    return page
+
+
+def _key_value(item, key):
+    if isinstance(item, dict):
+        return item[key]
+    return getattr(item, key)
@@ -0,0 +1,106 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+# set while serving a request that must read from the primary
+pin_primary = ContextVar("pin_primary", default=False)
+# set once the request has written, so the response can keep the client pinned
+wrote = ContextVar("wrote", default=None)
+# the replica picked for the request, every read of the request goes to it so an
+# ETag and the page it describes come from the same copy of the data
+read_alias = ContextVar("read_alias", default=None)
+
+# sessions are cached by cached_db from whatever the read returns, a lagging
+# replica could bring a logged out session back for its whole lifetime
+PRIMARY_ONLY = {"sessions.Session"}
+
+
+def replicas():
+    return getattr(settings, "DATABASE_REPLICAS", [])
+
+
+class PrimaryReplicaRouter:
+    """Send writes to the primary and spread reads over DATABASE_REPLICAS.
+
+    Reads stay on the primary inside a transaction, after a write in the same
+    request, and while ReadYourWritesMiddleware has pinned the client. Otherwise
+    a request reads from the one replica the middleware picked for it.
+    """
+
+    def db_for_read(self, model, **hints):
+        aliases = replicas()
+        if (
+            not aliases
+            or pin_primary.get()
+            or model._meta.label in PRIMARY_ONLY
+            or connections[DEFAULT_DB_ALIAS].in_atomic_block
+        ):
+            return DEFAULT_DB_ALIAS
+        written = wrote.get()
+        if written is not None and written[0]:
+            return DEFAULT_DB_ALIAS
+        return read_alias.get() or random.choice(aliases)
+
+    def db_for_write(self, model, **hints):
+        written = wrote.get()
+        if written is not None:
+            written[0] = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # every alias holds the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get their schema from the primary
+        return db == DEFAULT_DB_ALIAS
+
+
+@contextmanager
+def use_primary():
+    """Send every read in the block to the primary.
+
+    For reads whose result outlives the request (cache fills): a lagging
+    replica would otherwise put data that is already stale back into the cache.
+    """
+    token = pin_primary.set(True)
+    try:
+        yield
+    finally:
+        pin_primary.reset(token)
+
+
+class ReadYourWritesMiddleware:
+    # after a write the client reads from the primary until replicas have caught up
+
+    cookie_name = "auctions_primary"
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        pinned = bool(request.COOKIES.get(self.cookie_name))
+        aliases = replicas()
+        written = [False]
+        pin_token = pin_primary.set(pinned)
+        wrote_token = wrote.set(written)
+        alias_token = read_alias.set(random.choice(aliases) if aliases else None)
+        try:
+            response = self.get_response(request)
+        finally:
+            pin_primary.reset(pin_token)
+            wrote.reset(wrote_token)
+            read_alias.reset(alias_token)
+        if written[0] and aliases:
+            response.set_cookie(
+                self.cookie_name,
+                "1",
+                max_age=getattr(settings, "REPLICA_STICKY_SECONDS", 5),
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
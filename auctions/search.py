@@ -0,0 +1,116 @@
+import re
+
+from django.db import connection, connections
+
+from .models import Listing
+from .pagination import PAGE_SIZE, KeysetPage
+
+
+FTS_TABLE = "auctions_listing_fts"
+# title matches weigh more than description matches
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+_word = re.compile(r"\w+", re.UNICODE)
+
+# same triggers as migration 0011, SQLite drops them whenever a migration rebuilds the table
+SEARCH_TRIGGERS = [
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+]
+
+
+def install_search_triggers(sender=None, using="default", **kwargs):
+    # post_migrate handler, puts back triggers lost by a table rebuild
+    db = connections[using]
+    if db.vendor != "sqlite" or FTS_TABLE not in db.introspection.table_names():
+        return
+    with db.cursor() as cursor:
+        for statement in SEARCH_TRIGGERS:
+            cursor.execute(statement)
+
+
+def build_match_query(text):
+    # quote every word so user input can't use FTS5 operators, and match word prefixes
+    words = _word.findall(text or "")
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def encode_cursor(score, listing_id):
+    return f"{score!r}:{listing_id}"
+
+
+def parse_search_cursor(value):
+    try:
+        score, listing_id = (value or "").split(":")
+        return float(score), int(listing_id)
+    except ValueError:
+        return None
+
+
+def _ranked_ids(match, seek, backwards, limit):
+    # bm25 is lower for better matches, (score, id) is the unique seek key
+    order = "DESC" if backwards else "ASC"
+    sql = f"""
+        SELECT id, score FROM (
+            SELECT listing.id AS id,
+                   bm25({FTS_TABLE}, %s, %s) AS score
+            FROM {FTS_TABLE}
+            JOIN auctions_listing AS listing ON listing.id = {FTS_TABLE}.rowid
+            WHERE {FTS_TABLE} MATCH %s AND listing.is_active
+        )
+    """
+    params = [TITLE_WEIGHT, DESCRIPTION_WEIGHT, match]
+    if seek is not None:
+        sql += f" WHERE (score, id) {'<' if backwards else '>'} (%s, %s)"
+        params.extend(seek)
+    sql += f" ORDER BY score {order}, id {order} LIMIT %s"
+    params.append(limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+
+def search_listings(text, after=None, before=None, page_size=PAGE_SIZE, queryset=None):
+    match = build_match_query(text)
+    if not match:
+        return KeysetPage()
+
+    backwards = before is not None
+    rows = _ranked_ids(match, before if backwards else after, backwards, page_size + 1)
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if backwards:
+        rows.reverse()
+        has_next, has_previous = True, has_more
+    else:
+        has_next, has_previous = has_more, after is not None
+
+    # one query for the cards, put back in rank order
+    queryset = Listing.objects.all() if queryset is None else queryset
+    listings = queryset.in_bulk([listing_id for listing_id, _ in rows])
+    page = KeysetPage(items=[listings[listing_id] for listing_id, _ in rows if listing_id in listings])
+    if rows:
+        if has_next:
+            page.next_cursor = encode_cursor(rows[-1][1], rows[-1][0])
+        if has_previous:
+            page.prev_cursor = encode_cursor(rows[0][1], rows[0][0])
+    return page
@@ -0,0 +1,170 @@
+from django.db import transaction
+from django.db.models import Count, Exists, F, IntegerField, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .cache import invalidate_listing, invalidate_listings, invalidate_watched
+from .events import publish_on_commit
+from .leaderboard import record_bid
+from .models import Bid, Comment, Listing, OutboxEvent, UserWatchlist
+from .money import to_decimal
+
+
+class BidRejected(Exception):
+    pass
+
+
+class CloseRejected(Exception):
+    pass
+
+
+# ---- start place bid ----
+def place_bid(listing_id, bidder, amount):
+    amount = to_decimal(amount)
+    with transaction.atomic():
+        # compare-and-set: the price only moves if it is still below this bid,
+        # so two concurrent bidders can never both win or push the price down
+        updated = Listing.objects.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=timezone.now()),
+            pk=listing_id,
+            is_active=True,
+            bid_current__lt=amount,
+        ).update(
+            bid_current=amount,
+            bid_count=F("bid_count") + 1,
+            high_bidder=bidder,
+            # .update() skips auto_now, the conditional GET markers rely on this
+            updated_at=timezone.now(),
+        )
+        if not updated:
+            raise BidRejected("Your bid must be higher than the current bid.")
+        # the row is locked by the update until commit, so bids are stored in price order
+        bid = Bid.objects.create(listing_id=listing_id, bidder=bidder, amount=amount)
+        # watchers are told by the notification worker, never inside the request
+        OutboxEvent.objects.create(kind=OutboxEvent.BID, listing_id=listing_id, actor=bidder, amount=amount)
+        invalidate_listing(listing_id)
+        publish_on_commit(listing_id, "bid", {"bid_current": amount})
+        # rejected and rolled back bids never reach the leaderboard
+        transaction.on_commit(lambda: record_bid(listing_id))
+    return bid
+# ---- end place bid ----
+
+
+# ---- start close auction ----
+def close_auction(listing_id, user):
+    with transaction.atomic():
+        # the guarded UPDATE comes first: a read would start the deferred transaction
+        # with a shared lock that SQLite cannot upgrade once another writer got in,
+        # failing with "database is locked" instead of waiting for the busy timeout.
+        # Only someone who took part in the auction can close it, once it has a price.
+        # Bids only ever raise the price, so it is the last bid's amount. The is_active
+        # guard makes a second close a no-op: no new version, no second notification
+        closed = Listing.objects.filter(
+            Exists(Bid.objects.filter(bidder=user, listing=OuterRef("pk"))),
+            pk=listing_id,
+            is_active=True,
+            bid_current__gt=0,
+        ).update(is_active=False, updated_at=timezone.now())
+        if closed:
+            OutboxEvent.objects.create(kind=OutboxEvent.CLOSED, listing_id=listing_id)
+            invalidate_listing(listing_id)
+            return
+    # nothing was closed, work out why
+    if not Bid.objects.filter(bidder=user, listing_id=listing_id).exists():
+        raise CloseRejected("You haven't placed a bid for this listing.")
+    if Listing.objects.filter(pk=listing_id, is_active=False).exists():
+        raise CloseRejected("This auction is already closed.")
+    raise CloseRejected("Bid amount must be greater than 0.")
+# ---- end close auction ----
+
+
+# ---- start watchlist ----
+def watch_listings(user, listing_ids):
+    # one INSERT, listings already watched are skipped by the unique constraint
+    UserWatchlist.objects.bulk_create(
+        [UserWatchlist(user=user, listing_id=listing_id) for listing_id in listing_ids],
+        ignore_conflicts=True,
+    )
+    invalidate_watched(user.pk)
+
+
+def unwatch_listings(user, listing_ids):
+    # one DELETE, nothing cascades from a watchlist row
+    UserWatchlist.objects.filter(user=user, listing_id__in=listing_ids).delete()
+    invalidate_watched(user.pk)
+# ---- end watchlist ----
+
+
+# ---- start post comment ----
+def post_comment(listing_id, author, message):
+    with transaction.atomic():
+        updated = Listing.objects.filter(pk=listing_id).update(
+            comment_count=F("comment_count") + 1, updated_at=timezone.now()
+        )
+        if not updated:
+            raise Listing.DoesNotExist("Listing matching query does not exist.")
+        comment = Comment.objects.create(listing_id=listing_id, author=author, message=message)
+        invalidate_listing(listing_id)
+        publish_on_commit(listing_id, "comment", {
+            "author": author.username,
+            "message": message,
+        })
+    return comment
+# ---- end post comment ----
+
+
+# ---- start recompute listing stats ----
+def _count_per_listing(model):
+    counted = (
+        model.objects.filter(listing=OuterRef("pk"))
+        .order_by()
+        .values("listing")
+        .annotate(total=Count("id"))
+        .values("total")
+    )
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def recompute_listing_stats(queryset):
+    # one UPDATE with correlated subqueries, however many listings the queryset covers
+    top_bid = Bid.objects.filter(listing=OuterRef("pk")).order_by("-amount", "-id")
+    return queryset.update(
+        bid_count=_count_per_listing(Bid),
+        comment_count=_count_per_listing(Comment),
+        high_bidder=Subquery(top_bid.values("bidder")[:1]),
+        updated_at=timezone.now(),
+    )
+# ---- end recompute listing stats ----
+
+
+# ---- start close expired auctions ----
+CLOSE_BATCH_SIZE = 5000
+
+
+def close_expired_auctions(now=None, batch_size=CLOSE_BATCH_SIZE):
+    now = now or timezone.now()
+    # the winner is the top bid, picked by the same UPDATE that closes the listing
+    top_bid = Bid.objects.filter(listing=OuterRef("pk")).order_by("-amount", "-id")
+    closed = 0
+    while True:
+        # served by the partial index on ends_at of active listings
+        batch = list(
+            Listing.objects.filter(is_active=True, ends_at__lte=now)
+            .order_by("ends_at")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not batch:
+            return closed
+        with transaction.atomic():
+            # a single statement per batch, the is_active guard skips listings closed meanwhile
+            closed += Listing.objects.filter(id__in=batch, is_active=True).update(
+                is_active=False,
+                high_bidder=Subquery(top_bid.values("bidder")[:1]),
+                updated_at=now,
+            )
+            # a listing closed meanwhile gets a second event, the worker coalesces them
+            OutboxEvent.objects.bulk_create(
+                [OutboxEvent(kind=OutboxEvent.CLOSED, listing_id=listing_id) for listing_id in batch]
+            )
+            invalidate_listings(batch)
+# ---- end close expired auctions ----
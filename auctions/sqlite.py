@@ -0,0 +1,14 @@
+from django.conf import settings
+
+
+def apply_pragmas(connection, pragmas):
+    # connection is a raw sqlite3 connection, so the pragmas don't show up as queries
+    for name, value in pragmas.items():
+        connection.execute(f"PRAGMA {name} = {value}")
+
+
+def configure_sqlite(sender, connection, **kwargs):
+    # connection_created handler, tunes every new SQLite connection
+    if connection.vendor != "sqlite":
+        return
+    apply_pragmas(connection.connection, getattr(settings, "SQLITE_PRAGMAS", {}))
@@ -1,3 +1,1661 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
+from unittest import skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections, router, transaction
+from django.http import HttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from .auth import USER_KEY, check_shared_caches, user_cache
+from .benchmark import compare_session_backends, compare_to_baseline, generate_data, run_benchmarks
+from .cache import (
+    cache_stats, comment_page, fragment_cache, get_listing_snapshot, listing_cache, reset_cache_stats,
+)
+from .events import broker
+from .leaderboard import HOT_COUNT_KEY, HOT_RANKING_KEY, hot_cache, hot_listing_ids, record_bid
+from .models import Bid, Category, Comment, Listing, OutboxEvent, User, UserWatchlist
+from .money import parse_amount
+from .notifications import drain_outbox, get_sink
+from .pagination import COMMENT_PAGE_SIZE, PAGE_SIZE
+from .routers import ReadYourWritesMiddleware
+from .search import FTS_TABLE, build_match_query, parse_search_cursor, search_listings
+from .services import (
+    BidRejected, CloseRejected, close_auction, close_expired_auctions, place_bid, post_comment, watch_listings,
+)
+from .sqlite import apply_pragmas
+from .thumbnails import (
+    RefuseRedirects, SourceError, local_source_path, output_format, pending_listings, process_pending,
+    read_source, serve_media, store,
+)
+
+
+class ListingPaginationTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+        Listing.objects.bulk_create([
+            Listing(
+                title=f"Album {n}",
+                description="An album",
+                image_url="https://example.com/cover.jpg",
+                bid_current=10,
+                seller=cls.seller,
+                category=cls.category,
+            )
+            for n in range(PAGE_SIZE * 2 + 5)
+        ])
+        cls.ids = list(Listing.objects.order_by("id").values_list("id", flat=True))
+
+    def test_first_page_is_bounded(self):
+        response = self.client.get(reverse("index"))
+        page = response.context["actives"]
+        self.assertEqual([listing.id for listing in page], self.ids[:PAGE_SIZE])
+        self.assertFalse(page.has_previous)
+        self.assertEqual(page.next_cursor, self.ids[PAGE_SIZE - 1])
+
+    def test_next_and_previous_cursors_round_trip(self):
+        response = self.client.get(reverse("index"), {"after": self.ids[PAGE_SIZE - 1]})
+        page = response.context["actives"]
+        self.assertEqual([listing.id for listing in page], self.ids[PAGE_SIZE:PAGE_SIZE * 2])
+        self.assertTrue(page.has_previous)
+
+        response = self.client.get(reverse("index"), {"before": page.prev_cursor})
+        page = response.context["actives"]
+        self.assertEqual([listing.id for listing in page], self.ids[:PAGE_SIZE])
+        self.assertFalse(page.has_previous)
+
+    def test_last_page_has_no_next_cursor(self):
+        response = self.client.get(
+            reverse("category_listings", args=(self.category.slug,)),
+            {"after": self.ids[PAGE_SIZE * 2 - 1]},
+        )
+        page = response.context["actives"]
+        self.assertEqual(len(page), 5)
+        self.assertFalse(page.has_next)
+
+    def test_invalid_cursor_is_ignored(self):
+        response = self.client.get(reverse("index"), {"after": "nope"})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.context["actives"].has_previous)
+
+
+class ListingGridQueryCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("watcher", "watcher@example.com", "secret")
+        categories = [Category.objects.create(name=f"Genre {n}") for n in range(3)]
+        listings = Listing.objects.bulk_create([
+            Listing(
+                title=f"Album {n}",
+                description="An album",
+                image_url="https://example.com/cover.jpg",
+                bid_current=10,
+                seller=cls.user,
+                category=categories[n % 3],
+            )
+            for n in range(12)
+        ])
+        cls.category = categories[0]
+        UserWatchlist.objects.bulk_create([
+            UserWatchlist(user=cls.user, listing=listing) for listing in listings
+        ])
+
+    def setUp(self):
+        # rendered cards would hide the queries of a fresh render
+        fragment_cache().clear()
+
+    def test_index_query_count_does_not_grow_with_cards(self):
+        # freshness marker + categories dropdown + one joined page of listings
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "Genre 1")
+
+    def test_category_page_query_count(self):
+        # freshness marker + category header + one joined page of listings
+        with self.assertNumQueries(3):
+            self.client.get(reverse("category_listings", args=(self.category.slug,)))
+
+    def test_watchlist_query_count(self):
+        self.client.force_login(self.user)
+        listing_cache().clear()
+        # the session is cached by login; the user, one joined query for the watched
+        # listings and the watched ids for the card badges are read on first use
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("watchlist"))
+        self.assertEqual(len(response.context["listings"]), 12)
+        fragment_cache().clear()
+        with self.assertNumQueries(1):
+            self.client.get(reverse("watchlist"))
+
+
+class PlaceBidTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=cls.seller, category=Category.objects.create(name="Vinyl"),
+        )
+
+    def test_higher_bid_moves_the_price(self):
+        bid = place_bid(self.listing.id, self.bidder, 15)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_current, 15)
+        self.assertEqual(bid.amount, 15)
+
+    def test_lower_or_equal_bid_is_rejected_without_writes(self):
+        for amount in (5, 10):
+            with self.assertRaises(BidRejected):
+                place_bid(self.listing.id, self.bidder, amount)
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_current, 10)
+        self.assertFalse(Bid.objects.exists())
+
+    def test_closed_listing_rejects_bids(self):
+        Listing.objects.filter(pk=self.listing.pk).update(is_active=False)
+        with self.assertRaises(BidRejected):
+            place_bid(self.listing.id, self.bidder, 100)
+
+    def test_add_bid_view_uses_the_service(self):
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "20"})
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "12"})
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_current, 20)
+        self.assertEqual(Bid.objects.count(), 1)
+
+
+class ConcurrentBiddingStressTests(TransactionTestCase):
+    threads = 8
+    bids_per_thread = 40
+
+    def setUp(self):
+        seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        self.bidders = [
+            User.objects.create_user(f"bidder{n}", f"bidder{n}@example.com", "secret")
+            for n in range(self.threads)
+        ]
+        self.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=0, seller=seller
+        )
+
+    def bid_worker(self, bidder, accepted, barrier):
+        rng = random.Random(bidder.id)
+        barrier.wait()
+        try:
+            for _ in range(self.bids_per_thread):
+                while True:
+                    # outbid whatever this bidder last saw, like a bidder racing the clock
+                    try:
+                        current = Listing.objects.values_list("bid_current", flat=True).get(
+                            pk=self.listing.id
+                        )
+                    except OperationalError:
+                        time.sleep(0.001)
+                        continue
+                    amount = current + rng.randint(1, 3)
+                    try:
+                        bid = place_bid(self.listing.id, bidder, amount)
+                    except BidRejected:
+                        break
+                    except OperationalError:
+                        # sqlite reports a busy writer instead of waiting, try again
+                        time.sleep(0.001)
+                        continue
+                    accepted.append(bid.amount)
+                    break
+        finally:
+            connection.close()
+
+    def test_concurrent_bids_are_never_lost_or_out_of_order(self):
+        accepted = []
+        barrier = threading.Barrier(self.threads)
+        workers = [
+            threading.Thread(target=self.bid_worker, args=(bidder, accepted, barrier))
+            for bidder in self.bidders
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+
+        stored = list(
+            Bid.objects.filter(listing=self.listing).order_by("id").values_list("amount", flat=True)
+        )
+        self.listing.refresh_from_db()
+        # every accepted bid is stored, and stored bids only ever go up
+        self.assertEqual(sorted(stored), sorted(accepted))
+        self.assertEqual(stored, sorted(set(stored)))
+        self.assertEqual(self.listing.bid_current, stored[-1])
+        sys.stderr.write(
+            f"\n{len(accepted)} accepted bids in {elapsed:.2f}s "
+            f"({len(accepted) / elapsed:.0f} accepted bids/s) "
+        )
+
+
+class QueryPlanTests(TestCase):
+    # the category dropdown lists every category on purpose, everything else must seek
+    full_scan = re.compile(r"^SCAN (?!auctions_category$)(\w+)$")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+        cls.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=cls.user, category=cls.category,
+        )
+        Bid.objects.create(bidder=cls.user, listing=cls.listing, amount=15)
+        UserWatchlist.objects.create(user=cls.user, listing=cls.listing)
+
+    def setUp(self):
+        # a cached listing page would hide its queries from the plan check
+        listing_cache().clear()
+
+    def assertNoFullScans(self, method, url):
+        with CaptureQueriesContext(connection) as ctx:
+            getattr(self.client, method)(url)
+        # guarded UPDATEs carry the write's lookups, they are planned like SELECTs
+        statements = [
+            query["sql"] for query in ctx.captured_queries if query["sql"].startswith(("SELECT", "UPDATE"))
+        ]
+        self.assertTrue(statements)
+        for sql in statements:
+            with connection.cursor() as cursor:
+                cursor.execute("EXPLAIN QUERY PLAN " + sql)
+                details = [row[3] for row in cursor.fetchall()]
+            for detail in details:
+                self.assertIsNone(self.full_scan.match(detail), f"{detail} in {sql}")
+
+    def test_listing_grids_use_indexes(self):
+        self.assertNoFullScans("get", reverse("index"))
+        self.assertNoFullScans("get", reverse("index") + f"?after={self.listing.id}")
+        self.assertNoFullScans("get", reverse("category_listings", args=(self.category.slug,)))
+
+    def test_listing_page_uses_indexes(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans("get", reverse("listing", args=(self.listing.id,)))
+        self.assertNoFullScans("get", reverse("watchlist"))
+
+    def test_write_views_use_indexes(self):
+        self.client.force_login(self.user)
+        self.assertNoFullScans("post", reverse("add_watchlist", args=(self.listing.id,)))
+        self.assertNoFullScans("post", reverse("close_auction", args=(self.listing.id,)))
+
+
+class ListingEventsTests(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        self.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=self.user, category=Category.objects.create(name="Vinyl"),
+        )
+
+    def test_broker_delivers_events_published_from_worker_threads(self):
+        async def watch():
+            subscription = broker.subscribe(self.listing.id)
+            try:
+                publisher = threading.Thread(
+                    target=broker.publish, args=(self.listing.id, "bid", {"bid_current": 12})
+                )
+                publisher.start()
+                publisher.join()
+                return await asyncio.wait_for(subscription.queue.get(), timeout=1)
+            finally:
+                broker.unsubscribe(subscription)
+
+        self.assertEqual(asyncio.run(watch()), ("bid", {"bid_current": 12}))
+        self.assertEqual(broker.subscriber_count(self.listing.id), 0)
+
+    def test_accepted_bid_is_published_after_commit(self):
+        async def watch():
+            subscription = broker.subscribe(self.listing.id)
+            try:
+                await asyncio.to_thread(place_bid, self.listing.id, self.user, 20)
+                return await asyncio.wait_for(subscription.queue.get(), timeout=1)
+            finally:
+                broker.unsubscribe(subscription)
+
+        self.assertEqual(asyncio.run(watch()), ("bid", {"bid_current": 20}))
+
+    def test_stream_starts_with_the_current_price(self):
+        async def first_event():
+            response = await self.async_client.get(
+                reverse("listing_events", args=(self.listing.id,))
+            )
+            chunks = aiter(response.streaming_content)
+            try:
+                return response, await anext(chunks)
+            finally:
+                await chunks.aclose()
+
+        response, chunk = asyncio.run(first_event())
+        self.assertEqual(response["Content-Type"], "text/event-stream")
+        self.assertEqual(chunk, b'event: bid\ndata: {"bid_current": "10.00"}\n\n')
+        self.assertEqual(broker.subscriber_count(self.listing.id), 0)
+
+    def test_wsgi_clients_fall_back_to_polling(self):
+        response = self.client.get(reverse("listing_events", args=(self.listing.id,)))
+        self.assertContains(response, "retry: 5000")
+        self.assertContains(response, '"bid_current": "10.00"')
+
+
+class ListingCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=cls.seller, category=Category.objects.create(name="Vinyl"),
+        )
+
+    def setUp(self):
+        listing_cache().clear()
+        reset_cache_stats()
+
+    def get_listing(self):
+        return self.client.get(reverse("listing", args=(self.listing.id,)))
+
+    def test_second_view_is_served_from_the_cache(self):
+        # freshness marker + listing + comments on a miss, only the marker on a hit
+        with self.assertNumQueries(3):
+            self.get_listing()
+        with self.assertNumQueries(1):
+            response = self.get_listing()
+        self.assertContains(response, "By (owner) seller")
+        self.assertEqual(cache_stats(), {"hits": 1, "misses": 1})
+
+    def test_bid_invalidates_the_listing(self):
+        self.get_listing()
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "25"})
+        self.assertEqual(self.get_listing().context["listing"].bid_current, 25)
+
+    def test_comment_invalidates_the_listing(self):
+        self.get_listing()
+        self.client.force_login(self.bidder)
+        self.client.post(
+            reverse("add_comment", args=(self.listing.id,)), {"comment_content": "Nice pressing"}
+        )
+        self.assertContains(self.get_listing(), "Nice pressing")
+
+    def test_close_auction_invalidates_the_listing(self):
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "25"})
+        self.get_listing()
+        self.client.post(reverse("close_auction", args=(self.listing.id,)))
+        self.assertFalse(self.get_listing().context["listing"].is_active)
+
+    def test_snapshot_older_than_the_listing_is_reloaded(self):
+        self.get_listing()
+        # a bid in another process, which cannot invalidate this process's cache
+        Listing.objects.filter(pk=self.listing.pk).update(bid_current=25, updated_at=timezone.now())
+        response = self.get_listing()
+        self.assertEqual(response.context["listing"].bid_current, 25)
+        self.assertEqual(cache_stats(), {"hits": 0, "misses": 2})
+
+
+class ListingSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        category = Category.objects.create(name="Vinyl")
+        cls.title_match = Listing.objects.create(
+            title="Kind of Blue", description="Miles Davis, 1959", image_url="",
+            seller=seller, category=category,
+        )
+        cls.description_match = Listing.objects.create(
+            title="Sketches of Spain", description="Another blue classic", image_url="",
+            seller=seller, category=category,
+        )
+        Listing.objects.bulk_create([
+            Listing(title=f"Blue {n}", description="Bulk", image_url="", seller=seller, category=category)
+            for n in range(PAGE_SIZE)
+        ])
+
+    def test_match_query_escapes_operators(self):
+        self.assertEqual(build_match_query('blue" OR NEAR(x'), '"blue"* "OR"* "NEAR"* "x"*')
+        self.assertEqual(build_match_query("  "), "")
+
+    def test_title_matches_rank_above_description_matches(self):
+        ids = [listing.id for listing in search_listings("davis")]
+        self.assertEqual(ids, [self.title_match.id])
+        ids = [listing.id for listing in search_listings("spain blue")]
+        self.assertEqual(ids, [self.description_match.id])
+
+    def test_index_follows_updates_and_closed_listings_are_hidden(self):
+        Listing.objects.filter(pk=self.title_match.pk).update(title="Bitches Brew")
+        self.assertFalse(search_listings("kind"))
+        self.assertTrue(search_listings("brew"))
+        Listing.objects.filter(pk=self.title_match.pk).update(is_active=False)
+        self.assertFalse(search_listings("brew"))
+
+    def test_results_are_keyset_paginated(self):
+        first = search_listings("blue")
+        self.assertEqual(len(first), PAGE_SIZE)
+        second = search_listings("blue", after=parse_search_cursor(first.next_cursor))
+        self.assertEqual(len(second), 2)
+        self.assertFalse(second.has_next)
+        seen = {listing.id for listing in first} | {listing.id for listing in second}
+        self.assertEqual(len(seen), PAGE_SIZE + 2)
+        back = search_listings("blue", before=parse_search_cursor(second.prev_cursor))
+        self.assertEqual([listing.id for listing in back], [listing.id for listing in first])
+
+    def test_search_view_and_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')")
+        self.assertFalse(search_listings("davis"))
+        call_command("rebuild_search_index", stdout=open(os.devnull, "w"))
+        response = self.client.get(reverse("search"), {"q": "davis"})
+        self.assertContains(response, "Kind of Blue")
+
+
+class ListingStatsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.alice = User.objects.create_user("alice", "alice@example.com", "secret")
+        cls.bob = User.objects.create_user("bob", "bob@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=cls.seller, category=Category.objects.create(name="Vinyl"),
+        )
+
+    def setUp(self):
+        # rendered cards would hide the queries of a fresh render
+        fragment_cache().clear()
+
+    def test_bids_and_comments_keep_stats_current(self):
+        place_bid(self.listing.id, self.alice, 15)
+        place_bid(self.listing.id, self.bob, 20)
+        with self.assertRaises(BidRejected):
+            place_bid(self.listing.id, self.alice, 18)
+        post_comment(self.listing.id, self.alice, "Still sealed?")
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 2)
+        self.assertEqual(self.listing.high_bidder, self.bob)
+        self.assertEqual(self.listing.comment_count, 1)
+
+    def test_cards_render_stats_without_extra_queries(self):
+        place_bid(self.listing.id, self.alice, 15)
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, "1 bid, leading bidder alice")
+
+    def test_recompute_command_repairs_drift(self):
+        place_bid(self.listing.id, self.alice, 15)
+        post_comment(self.listing.id, self.bob, "Nice")
+        Listing.objects.update(bid_count=7, comment_count=0, high_bidder=None)
+        call_command("recompute_listing_stats", batch_size=1, stdout=open(os.devnull, "w"))
+        self.listing.refresh_from_db()
+        self.assertEqual(
+            (self.listing.bid_count, self.listing.comment_count, self.listing.high_bidder),
+            (1, 1, self.alice),
+        )
+
+
+class AuctionExpiryTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        now = timezone.now()
+        cls.expired = Listing.objects.bulk_create([
+            Listing(title=f"Expired {n}", description="", image_url="", seller=cls.seller,
+                    ends_at=now + timedelta(minutes=1))
+            for n in range(50)
+        ])
+        cls.running = Listing.objects.create(
+            title="Running", description="", image_url="", seller=cls.seller,
+            ends_at=now + timedelta(days=1),
+        )
+        cls.open_ended = Listing.objects.create(title="Open", description="", image_url="", seller=cls.seller)
+        place_bid(cls.expired[0].id, cls.seller, 5)
+        place_bid(cls.expired[0].id, cls.bidder, 8)
+        cls.later = now + timedelta(minutes=2)
+
+    def test_expired_auctions_close_in_batched_statements(self):
+        # per batch: find ids, then close them and queue their outbox events in one
+        # savepoint; then one empty lookup
+        with self.assertNumQueries(11):
+            closed = close_expired_auctions(now=self.later, batch_size=40)
+        self.assertEqual(closed, 50)
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.CLOSED).count(), 50)
+        self.assertFalse(Listing.objects.filter(title__startswith="Expired", is_active=True).exists())
+        self.assertTrue(Listing.objects.get(pk=self.running.pk).is_active)
+        self.assertTrue(Listing.objects.get(pk=self.open_ended.pk).is_active)
+
+    def test_winner_is_the_top_bid(self):
+        close_expired_auctions(now=self.later)
+        self.assertEqual(Listing.objects.get(pk=self.expired[0].pk).high_bidder, self.bidder)
+        self.assertIsNone(Listing.objects.get(pk=self.expired[1].pk).high_bidder)
+
+    def test_bids_after_the_end_time_are_rejected(self):
+        Listing.objects.filter(pk=self.running.pk).update(ends_at=timezone.now() - timedelta(seconds=1))
+        with self.assertRaises(BidRejected):
+            place_bid(self.running.id, self.bidder, 100)
+
+    def test_expiry_lookup_uses_the_partial_index(self):
+        queryset = Listing.objects.filter(is_active=True, ends_at__lte=self.later).order_by("ends_at")
+        self.assertIn("listing_active_ends_at_idx", queryset.values("id").explain())
+
+
+class CreateListingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+
+    def create(self, ends_at):
+        self.client.force_login(self.seller)
+        return self.client.post(reverse("create"), {
+            "title": "Album", "description": "", "image_url": "", "price": "5",
+            "category": self.category.id, "active": "on", "ends_at": ends_at,
+        })
+
+    def test_impossible_and_past_end_dates_are_refused(self):
+        for ends_at, message in (
+            ("2030-02-30T10:00", "The end date is not a valid date."),
+            ("2020-01-01T10:00", "The end date must be in the future."),
+        ):
+            response = self.create(ends_at)
+            self.assertContains(response, message)
+        self.assertFalse(Listing.objects.exists())
+
+    def test_future_end_date_is_kept(self):
+        self.create((timezone.now() + timedelta(days=1)).strftime("%Y-%m-%dT%H:%M"))
+        self.assertIsNotNone(Listing.objects.get().ends_at)
+
+
+class ImportListingsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+
+    def import_file(self, suffix, content, **options):
+        with tempfile.NamedTemporaryFile("w", suffix=suffix, delete=False) as dump:
+            dump.write(content)
+        self.addCleanup(os.remove, dump.name)
+        stdout, stderr = io.StringIO(), io.StringIO()
+        call_command("import_listings", dump.name, stdout=stdout, stderr=stderr, **options)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_csv_import_in_batches(self):
+        rows = "\n".join(f"Album {n},Desc,https://example.com/{n}.jpg,{n},vinyl" for n in range(25))
+        # category lookup + seller + one INSERT per batch of 10
+        with self.assertNumQueries(2 + 3):
+            stdout, stderr = self.import_file(
+                ".csv", "title,description,image_url,price,category\n" + rows + "\n",
+                seller="seller", batch_size=10,
+            )
+        self.assertIn("Imported 25 listings", stdout)
+        self.assertEqual(Listing.objects.filter(category=self.category, seller=self.seller).count(), 25)
+
+    def test_error_rows_are_reported_and_skipped(self):
+        stdout, stderr = self.import_file(".jsonl", "\n".join([
+            json.dumps({"title": "Good", "price": 5, "category": "vinyl"}),
+            "{not json",
+            json.dumps({"title": "", "price": 5}),
+            json.dumps({"title": "Bad category", "category": "tapes"}),
+            json.dumps({"title": "Bad price", "price": "lots"}),
+        ]))
+        self.assertIn("Imported 1 listings", stdout)
+        self.assertIn("4 error rows", stdout)
+        self.assertIn("line 4: unknown category 'tapes'", stderr)
+        self.assertEqual(list(Listing.objects.values_list("title", flat=True)), ["Good"])
+
+    def test_non_string_fields_are_error_rows(self):
+        stdout, stderr = self.import_file(".jsonl", "\n".join([
+            json.dumps({"title": 5}),
+            json.dumps({"title": "Number", "description": 3}),
+            json.dumps({"title": "List", "category": 1}),
+            json.dumps({"title": "Good", "image_url": None}),
+        ]))
+        self.assertIn("Imported 1 listings", stdout)
+        self.assertIn("3 error rows", stdout)
+        self.assertIn("line 2: description must be text, got 3", stderr)
+        self.assertEqual(list(Listing.objects.values_list("title", flat=True)), ["Good"])
+
+    def test_listings_without_a_category_are_rendered(self):
+        self.import_file(".jsonl", json.dumps({"title": "Loose", "price": 5}))
+        listing = Listing.objects.get()
+        self.assertIsNone(listing.category_id)
+        self.assertContains(self.client.get(reverse("index")), "Category: none")
+        self.assertContains(self.client.get(reverse("listing", args=(listing.id,))), "Category: none")
+
+
+class BenchmarkSuiteTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        generate_data(users=5, categories=2, listings=20, bids=3, comments=2)
+        listing = Listing.objects.select_related("high_bidder").first()
+        top_bid = Bid.objects.filter(listing=listing).order_by("-amount").first()
+        self.assertEqual(listing.bid_count, 3)
+        self.assertEqual(listing.bid_current, top_bid.amount)
+        self.assertEqual(listing.high_bidder_id, top_bid.bidder_id)
+        self.assertEqual(Comment.objects.count(), 40)
+
+    def test_every_view_is_measured(self):
+        generate_data(users=5, categories=2, listings=20, bids=1, comments=1)
+        results = run_benchmarks(requests=3)
+        self.assertEqual(set(results), {
+            "index", "index_page", "category_listings", "listing_by_id", "add_bid", "personal_watchlist",
+        })
+        for stats in results.values():
+            self.assertLessEqual(stats["p50_ms"], stats["p99_ms"])
+            self.assertGreater(stats["queries_per_request"], 0)
+
+    def test_baseline_comparison_flags_regressions(self):
+        baseline = {"index": {"p95_ms": 10.0, "queries_per_request": 2}}
+        self.assertEqual(compare_to_baseline({"index": {"p95_ms": 12.0, "queries_per_request": 2}}, baseline), [])
+        regressions = compare_to_baseline({"index": {"p95_ms": 20.0, "queries_per_request": 3}}, baseline)
+        self.assertEqual(len(regressions), 2)
+
+
+@override_settings(REQUEST_TIMING_ENABLED=True, REQUEST_TIMING_QUERY_BUDGET=1)
+class RequestTimingMiddlewareTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        Listing.objects.create(
+            title="Album", description="An album", image_url="", seller=seller,
+            category=Category.objects.create(name="Vinyl"),
+        )
+
+    def setUp(self):
+        # rendered cards would hide the queries of a fresh render
+        fragment_cache().clear()
+
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs("auctions.timing", "WARNING") as logs:
+            response = self.client.get(reverse("index"))
+        self.assertRegex(
+            response["Server-Timing"],
+            r'^total;dur=[\d.]+, db;dur=[\d.]+;desc="3 queries", tpl;dur=[\d.]+$',
+        )
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record["view"], "index")
+        self.assertEqual(record["queries"], 3)
+        self.assertTrue(record["over_budget"])
+        self.assertGreater(record["template_ms"], 0)
+        self.assertEqual(len(record["slowest_queries"]), 3)
+
+    @override_settings(REQUEST_TIMING_ENABLED=False)
+    def test_disabled_by_default(self):
+        response = self.client.get(reverse("index"))
+        self.assertNotIn("Server-Timing", response)
+
+
+class SqliteTuningTests(TestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f"PRAGMA {name}")
+            return cursor.fetchone()[0]
+
+    def test_pragmas_are_applied_on_connect(self):
+        self.assertEqual(self.pragma("busy_timeout"), 20000)
+        # synchronous=NORMAL
+        self.assertEqual(self.pragma("synchronous"), 1)
+        self.assertEqual(self.pragma("cache_size"), -20000)
+
+    def test_file_databases_switch_to_wal(self):
+        with tempfile.TemporaryDirectory() as directory:
+            raw = sqlite3.connect(os.path.join(directory, "wal.sqlite3"))
+            apply_pragmas(raw, {"journal_mode": "WAL"})
+            self.assertEqual(raw.execute("PRAGMA journal_mode").fetchone()[0], "wal")
+            raw.close()
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTests(SimpleTestCase):
+    def serve(self, cookies=None, write=False):
+        decisions = {}
+
+        def view(request):
+            decisions["before"] = router.db_for_read(Listing)
+            if write:
+                router.db_for_write(Bid)
+                decisions["after"] = router.db_for_read(Listing)
+            return HttpResponse()
+
+        request = RequestFactory().post("/") if write else RequestFactory().get("/")
+        request.COOKIES.update(cookies or {})
+        response = ReadYourWritesMiddleware(view)(request)
+        return decisions, response
+
+    def test_reads_go_to_replicas_and_writes_to_primary(self):
+        self.assertEqual(router.db_for_read(Listing), "replica")
+        self.assertEqual(router.db_for_write(Listing), "default")
+
+    def test_writes_pin_the_rest_of_the_request_and_the_client(self):
+        decisions, response = self.serve(write=True)
+        self.assertEqual(decisions, {"before": "replica", "after": "default"})
+        cookie = response.cookies[ReadYourWritesMiddleware.cookie_name]
+        self.assertEqual(cookie["max-age"], 5)
+
+        decisions, response = self.serve(cookies={ReadYourWritesMiddleware.cookie_name: "1"})
+        self.assertEqual(decisions, {"before": "default"})
+        self.assertNotIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_uses_the_primary(self):
+        decisions, response = self.serve(write=True)
+        self.assertEqual(decisions, {"before": "default", "after": "default"})
+        self.assertNotIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+
+
+@override_settings(DATABASE_REPLICAS=["replica"])
+class ReplicaRouterTransactionTests(TestCase):
+    def test_reads_inside_a_transaction_use_the_primary(self):
+        with transaction.atomic():
+            self.assertEqual(router.db_for_read(Listing), "default")
+
+
+class ReplicaDatabaseTests(TransactionTestCase):
+    """A second SQLite file stands in for a replica that stopped replicating."""
+
+    def setUp(self):
+        self.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        self.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        self.listing = Listing.objects.create(
+            title="Album", description="", image_url="", bid_current=10, seller=self.seller,
+            category=Category.objects.create(name="Vinyl"),
+        )
+        listing_cache().clear()
+        fragment_cache().clear()
+        # the replica is a copy of the primary as it is now, later writes never reach it
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, "replica.sqlite3")
+        copy = sqlite3.connect(path)
+        connection.ensure_connection()
+        connection.connection.backup(copy)
+        copy.close()
+        connections.settings["replica"] = {**connections.settings["default"], "NAME": path, "TEST": {}}
+        self.addCleanup(connections.settings.pop, "replica")
+        self.addCleanup(connections.__delitem__, "replica")
+        self.addCleanup(lambda: connections["replica"].close())
+        overrides = override_settings(DATABASE_REPLICAS=["replica"])
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def api_price(self, client):
+        return client.get(reverse("api_listing", args=(self.listing.id,)), {"fields": "bid_current"}).json()
+
+    def test_replica_reads_are_stale_until_the_client_writes(self):
+        self.client.force_login(self.bidder)
+        response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "20"})
+        self.assertIn(ReadYourWritesMiddleware.cookie_name, response.cookies)
+        # the bidder reads the primary, anyone else the replica without the bid
+        self.assertEqual(self.api_price(self.client)["bid_current"], "20.00")
+        self.assertEqual(self.api_price(Client())["bid_current"], "10.00")
+        self.assertEqual(Listing.objects.using("replica").get(pk=self.listing.pk).bid_current, Decimal("10.00"))
+
+    def test_streamed_pages_keep_the_request_alias(self):
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "20"})
+        response = self.client.get(reverse("api_listings"), {"fields": "bid_current"})
+        self.assertTrue(response.streaming)
+        page = json.loads(b"".join(response.streaming_content))
+        self.assertEqual(page["results"], [{"id": self.listing.id, "bid_current": "20.00"}])
+
+    def test_cache_fills_come_from_the_primary(self):
+        place_bid(self.listing.id, self.bidder, 20)
+        self.assertEqual(Listing.objects.get(pk=self.listing.pk).bid_current, Decimal("10.00"))
+        self.assertEqual(get_listing_snapshot(self.listing.id)["listing"].bid_current, Decimal("20.00"))
+        url = reverse("listing", args=(self.listing.id,))
+        self.assertContains(Client().get(url), '<span id="listing-price">20.00</span>')
+
+    def test_page_and_etag_are_read_from_the_same_alias(self):
+        url = reverse("category_listings", args=("vinyl",))
+        first = Client().get(url)
+        self.client.force_login(self.bidder)
+        self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "20"})
+        # the replica still has the old page, and still describes it with the old ETag
+        stale = Client().get(url)
+        self.assertContains(stale, "$10.00 CLP")
+        self.assertEqual(stale["ETag"], first["ETag"])
+        self.assertEqual(Client().get(url, HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304)
+        # the pinned bidder reads both from the primary
+        self.assertContains(self.client.get(url), "$20.00 CLP")
+
+
+class JsonApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+        cls.listings = Listing.objects.bulk_create([
+            Listing(title=f"Album {n}", description="An album", image_url="", bid_current=10,
+                    seller=cls.seller, category=cls.category)
+            for n in range(5)
+        ])
+
+    def get_json(self, url, params=None):
+        response = self.client.get(url, params or {})
+        body = b"".join(response.streaming_content) if response.streaming else response.content
+        return response, json.loads(body)
+
+    def test_listing_pages_are_streamed_with_sparse_fields(self):
+        response, page = self.get_json(reverse("api_listings"), {"fields": "title,category", "limit": 2})
+        self.assertTrue(response.streaming)
+        self.assertEqual(page["results"][0], {"id": self.listings[0].id, "title": "Album 0", "category": "vinyl"})
+        self.assertEqual(page["next"], self.listings[1].id)
+
+        _, page = self.get_json(reverse("api_listings"), {"after": page["next"], "limit": 10})
+        self.assertEqual([row["id"] for row in page["results"]], [listing.id for listing in self.listings[2:]])
+        self.assertIsNone(page["next"])
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get(reverse("api_listings"), {"fields": "title,password"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_listing_detail_uses_one_values_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse("api_listing", args=(self.listings[0].id,)), {"fields": "seller,bid_current"}
+            )
+        self.assertEqual(response.json(), {"id": self.listings[0].id, "seller": "seller", "bid_current": "10.00"})
+
+    def test_bids_comments_and_watchlist(self):
+        listing_id = self.listings[0].id
+        self.assertEqual(self.client.post(reverse("api_bids", args=(listing_id,)), {"amount": 20}).status_code, 401)
+
+        self.client.force_login(self.bidder)
+        response = self.client.post(
+            reverse("api_bids", args=(listing_id,)), {"amount": 20}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        response = self.client.post(reverse("api_bids", args=(listing_id,)), {"amount": 15})
+        self.assertEqual(response.status_code, 409)
+
+        response = self.client.post(reverse("api_comments", args=(listing_id,)), {"message": "Mint?"})
+        self.assertEqual(response.status_code, 201)
+        _, page = self.get_json(reverse("api_comments", args=(listing_id,)))
+        self.assertEqual(page["results"][0]["author"], "bidder")
+
+        self.client.put(reverse("api_watchlist_entry", args=(listing_id,)))
+        self.client.put(reverse("api_watchlist_entry", args=(listing_id,)))
+        _, page = self.get_json(reverse("api_watchlist"), {"fields": "bid_current"})
+        self.assertEqual(page["results"], [{"id": listing_id, "bid_current": "20.00"}])
+        self.client.delete(reverse("api_watchlist_entry", args=(listing_id,)))
+        _, page = self.get_json(reverse("api_watchlist"))
+        self.assertEqual(page["results"], [])
+
+    def test_bodies_that_are_not_json_objects_are_rejected(self):
+        self.client.force_login(self.bidder)
+        listing_id = self.listings[0].id
+        for url in (reverse("api_bids", args=(listing_id,)), reverse("api_comments", args=(listing_id,))):
+            for body in ("[]", '"x"', "5", "null"):
+                response = self.client.post(url, body, content_type="application/json")
+                self.assertEqual(response.status_code, 400, (url, body))
+                self.assertEqual(response.json(), {"error": "Expected a JSON object."})
+        response = self.client.post(
+            reverse("api_comments", args=(listing_id,)), {"message": 5}, content_type="application/json"
+        )
+        self.assertEqual(response.json(), {"error": "message must be a string."})
+        self.assertFalse(Comment.objects.exists())
+
+
+class ConditionalPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+        cls.listing = Listing.objects.create(
+            title="Album", description="An album", image_url="", bid_current=10,
+            seller=cls.seller, category=cls.category,
+        )
+
+    def setUp(self):
+        listing_cache().clear()
+
+    def revalidate(self, url, response, **headers):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"], **headers)
+
+    def test_unchanged_pages_answer_304_from_one_query(self):
+        for url in (
+            reverse("index"),
+            reverse("category_listings", args=(self.category.slug,)),
+            reverse("listing", args=(self.listing.id,)),
+        ):
+            first = self.client.get(url)
+            self.assertEqual(first.status_code, 200)
+            with self.assertNumQueries(1):
+                response = self.revalidate(url, first)
+            self.assertEqual(response.status_code, 304, url)
+            self.assertEqual(response["ETag"], first["ETag"])
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first["Last-Modified"])
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_bids_comments_and_closing_change_the_version(self):
+        url = reverse("listing", args=(self.listing.id,))
+        Listing.objects.filter(pk=self.listing.pk).update(ends_at=timezone.now() + timedelta(hours=1))
+        for change in (
+            lambda: place_bid(self.listing.id, self.bidder, 15),
+            lambda: post_comment(self.listing.id, self.bidder, "Still sealed?"),
+            lambda: close_expired_auctions(now=timezone.now() + timedelta(days=1)),
+        ):
+            first = self.client.get(url)
+            change()
+            self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_category_pages_follow_their_listings(self):
+        url = reverse("category_listings", args=(self.category.slug,))
+        other = Category.objects.create(name="Books")
+        first = self.client.get(url)
+        Listing.objects.create(title="Novel", description="", image_url="", category=other)
+        self.assertEqual(self.revalidate(url, first).status_code, 304)
+        Listing.objects.create(title="Single", description="", image_url="", category=self.category)
+        self.assertEqual(self.revalidate(url, first).status_code, 200)
+
+    def test_anonymous_pages_are_publicly_cacheable(self):
+        response = self.client.get(reverse("listing", args=(self.listing.id,)))
+        self.assertIn("public", response["Cache-Control"])
+        self.assertIn("max-age=60", response["Cache-Control"])
+        self.assertIn("Cookie", response["Vary"])
+        self.assertNotContains(response, "csrfmiddlewaretoken")
+
+    def test_signed_in_pages_are_private_and_per_user(self):
+        url = reverse("listing", args=(self.listing.id,))
+        anonymous = self.client.get(url)
+        self.client.force_login(self.bidder)
+        response = self.client.get(url)
+        self.assertIn("private", response["Cache-Control"])
+        self.assertIn("no-cache", response["Cache-Control"])
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertEqual(self.revalidate(url, anonymous).status_code, 200)
+        self.assertEqual(self.revalidate(url, response).status_code, 304)
+        # watching the listing changes the button, so the cached copy is stale
+        watch_listings(self.bidder, [self.listing.id])
+        self.assertEqual(self.revalidate(url, response).status_code, 200)
+
+
+class FragmentCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+        cls.album, cls.single = [
+            Listing.objects.create(
+                title=title, description="", image_url="", bid_current=10,
+                seller=cls.seller, category=cls.category,
+            )
+            for title in ("Album", "Single")
+        ]
+
+    def setUp(self):
+        fragment_cache().clear()
+
+    def test_warm_index_skips_the_categories_query(self):
+        self.client.get(reverse("index"))
+        # freshness marker + one joined page of listings
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse("index"))
+        self.assertContains(response, '<option value="vinyl">Vinyl</option>', html=True)
+
+    def test_new_category_rebuilds_the_dropdown(self):
+        self.client.get(reverse("index"))
+        Category.objects.create(name="Books")
+        self.assertContains(self.client.get(reverse("index")), "Books")
+
+    def test_dropdown_is_versioned_without_signals(self):
+        self.client.get(reverse("index"))
+        # a bulk update, as another process would make it, sends no signal
+        Category.objects.filter(pk=self.category.pk).update(name="Records", updated_at=timezone.now())
+        self.assertContains(self.client.get(reverse("index")), "Records")
+
+    def test_a_bid_only_rebuilds_its_own_card(self):
+        self.client.get(reverse("index"))
+        # a write that leaves updated_at alone keeps serving the cached card
+        Listing.objects.filter(pk=self.single.pk).update(title="Renamed")
+        place_bid(self.album.id, self.bidder, 25)
+        response = self.client.get(reverse("index"))
+        self.assertContains(response, "$25.00 CLP")
+        self.assertContains(response, "leading bidder bidder")
+        self.assertContains(response, "Single")
+        self.assertNotContains(response, "Renamed")
+
+
+@override_settings(THUMBNAIL_FETCH_REMOTE=False)
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.category = Category.objects.create(name="Vinyl")
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        sources = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.addCleanup(sources.cleanup)
+        self.sources = sources.name
+        overrides = override_settings(MEDIA_ROOT=media.name, THUMBNAIL_SOURCE_ROOT=sources.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        fragment_cache().clear()
+
+    def listing(self, **fields):
+        return Listing.objects.create(
+            title="Album", description="", seller=self.seller, category=self.category, **fields
+        )
+
+    def write_image(self, name, size=(1600, 1200)):
+        from PIL import Image
+        Image.new("RGB", size, (200, 30, 30)).save(os.path.join(self.sources, name))
+
+    def upload(self, content, name):
+        upload = io.BytesIO(content)
+        upload.name = name
+        return self.client.post(reverse("create"), {
+            "title": "Album", "description": "", "image_url": "", "price": "5",
+            "category": self.category.id, "active": "on", "image_file": upload,
+        })
+
+    @skipUnless(importlib.util.find_spec("PIL"), "Pillow is not installed")
+    def test_upload_is_stored_under_its_content_hash(self):
+        self.client.force_login(self.seller)
+        self.write_image("cover.png", size=(8, 8))
+        with open(os.path.join(self.sources, "cover.png"), "rb") as image:
+            content = image.read()
+        # the extension comes from the decoded format, never from the client's name
+        for name in ("cover.PNG", "cover.html"):
+            self.upload(content, name)
+        names = set(Listing.objects.values_list("image_source", flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertRegex(names.pop(), r"^listings/originals/[0-9a-f]{32}\.png$")
+
+    @skipUnless(importlib.util.find_spec("PIL"), "Pillow is not installed")
+    def test_uploads_that_are_not_images_are_refused(self):
+        self.client.force_login(self.seller)
+        for content, name in (
+            (b"<html><script>alert(1)</script></html>", "cover.html"),
+            (b'<svg xmlns="http://www.w3.org/2000/svg" onload="alert(1)"/>', "cover.png"),
+        ):
+            response = self.upload(content, name)
+            self.assertEqual(response.status_code, 200)
+            self.assertContains(response, "Upload a JPEG, PNG, WebP or GIF image.")
+        self.assertFalse(Listing.objects.exists())
+
+    def test_grids_fall_back_to_image_url_until_processed(self):
+        listing = self.listing(image_url="https://example.com/cover.jpg")
+        with self.settings(THUMBNAIL_FETCH_REMOTE=True):
+            self.assertIn(listing, pending_listings())
+        self.assertContains(self.client.get(reverse("index")), 'src="https://example.com/cover.jpg"')
+
+    def test_local_sources_stay_inside_the_source_root(self):
+        self.assertEqual(local_source_path("file:///covers/a.png"), os.path.join(self.sources, "covers/a.png"))
+        self.assertIsNone(local_source_path("https://example.com/a.png"))
+        with self.assertRaises(SourceError):
+            local_source_path("../../etc/passwd")
+
+    def test_remote_sources_are_off_by_default(self):
+        with self.settings():
+            del settings.THUMBNAIL_FETCH_REMOTE
+            with self.assertRaisesMessage(SourceError, "THUMBNAIL_FETCH_REMOTE is off"):
+                read_source("", "https://example.com/cover.jpg")
+
+    @override_settings(THUMBNAIL_FETCH_REMOTE=True)
+    def test_remote_sources_must_be_public(self):
+        for url in (
+            "http://127.0.0.1/cover.jpg",
+            "http://localhost:8000/cover.jpg",
+            "http://169.254.169.254/latest/meta-data/",
+            "http://10.0.0.5/cover.jpg",
+            "http://[::ffff:192.168.0.1]/cover.jpg",
+        ):
+            with self.assertRaisesMessage(SourceError, "non-public address"):
+                read_source("", url)
+        with self.assertRaises(SourceError):
+            RefuseRedirects().redirect_request(None, None, 302, "Found", {}, "http://127.0.0.1/")
+
+    def test_media_is_served_with_a_long_lifetime(self):
+        # routed under MEDIA_URL when DEBUG is on, the test runner turns DEBUG off
+        name = store("listings/originals/abc.png", b"bytes")
+        response = serve_media(RequestFactory().get("/media/" + name), name)
+        self.assertIn("immutable", response["Cache-Control"])
+        self.assertIn(f"max-age={settings.MEDIA_CACHE_MAX_AGE}", response["Cache-Control"])
+
+    @skipUnless(importlib.util.find_spec("PIL"), "Pillow is not installed")
+    def test_workers_make_card_and_large_variants(self):
+        from PIL import Image
+        self.write_image("cover.png")
+        listing = self.listing(image_url="file:///cover.png")
+        missing = self.listing(image_url="file:///missing.png")
+        self.listing(image_url="https://example.com/offline.jpg")
+        self.assertEqual(process_pending(workers=2), (1, 1))
+
+        listing.refresh_from_db()
+        missing.refresh_from_db()
+        self.assertTrue(missing.thumbnail_failed)
+        extension = "webp" if output_format() == "WEBP" else "jpg"
+        self.assertRegex(listing.thumbnail, rf"^thumbnails/card/[0-9a-f]{{32}}\.{extension}$")
+        with default_storage.open(listing.thumbnail) as card, default_storage.open(listing.image_large) as large:
+            self.assertEqual(Image.open(card).size, (320, 240))
+            self.assertEqual(Image.open(large).size, (1280, 960))
+        self.assertContains(self.client.get(reverse("index")), f'src="/media/{listing.thumbnail}"')
+        self.assertContains(
+            self.client.get(reverse("listing", args=(listing.id,))), f'src="/media/{listing.image_large}"'
+        )
+        self.assertEqual(process_pending(workers=0), (0, 0))
+
+    @skipUnless(importlib.util.find_spec("PIL"), "Pillow is not installed")
+    def test_remote_images_wait_and_failures_can_be_retried(self):
+        remote = self.listing(image_url="https://example.com/cover.jpg")
+        missing = self.listing(image_url="file:///cover.png")
+        stdout = io.StringIO()
+        call_command("process_thumbnails", workers=0, stdout=stdout)
+        self.assertIn("Made thumbnails for 0 listings (1 failed)", stdout.getvalue())
+        remote.refresh_from_db()
+        self.assertFalse(remote.thumbnail_failed)
+        self.assertNotIn(remote, pending_listings())
+
+        self.write_image("cover.png")
+        call_command("process_thumbnails", workers=0, stdout=stdout)
+        self.assertIn("Made thumbnails for 0 listings (0 failed)", stdout.getvalue())
+        call_command("process_thumbnails", "--retry-failed", workers=0, stdout=stdout)
+        self.assertIn("Retrying 1 failed listings", stdout.getvalue())
+        self.assertIn("Made thumbnails for 1 listings (0 failed)", stdout.getvalue())
+        missing.refresh_from_db()
+        self.assertTrue(missing.thumbnail)
+
+
+class MoneyTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="", image_url="", bid_current=Decimal("0.30"),
+            seller=cls.seller, category=Category.objects.create(name="Vinyl"),
+        )
+
+    def test_amounts_are_stored_as_integer_cents(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT bid_current, typeof(bid_current) FROM auctions_listing WHERE id = %s",
+                [self.listing.id],
+            )
+            self.assertEqual(cursor.fetchone(), (30, "integer"))
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_current, Decimal("0.30"))
+
+    def test_bid_comparisons_are_exact(self):
+        # 0.1 + 0.2 > 0.3 in floating point, it must not count as a higher bid
+        with self.assertRaises(BidRejected):
+            place_bid(self.listing.id, self.bidder, 0.1 + 0.2)
+        place_bid(self.listing.id, self.bidder, Decimal("0.31"))
+        self.assertEqual(Bid.objects.get().amount, Decimal("0.31"))
+
+    def test_amounts_with_sub_cent_precision_are_refused(self):
+        for value in ("10.001", "-1", "nan", "abc", ""):
+            with self.assertRaises(ValueError):
+                parse_amount(value)
+        self.assertEqual(parse_amount(" 12.5 "), Decimal("12.50"))
+        self.client.force_login(self.bidder)
+        response = self.client.post(reverse("api_bids", args=(self.listing.id,)), {"amount": "1.005"})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bid.objects.exists())
+
+    def test_top_listings_by_price_are_read_off_the_index(self):
+        top = Listing.objects.filter(is_active=True).order_by("-bid_current", "-id")[:10]
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + str(top.query))
+            details = " ".join(row[3] for row in cursor.fetchall())
+        self.assertIn("listing_active_price_idx", details)
+        self.assertNotIn("TEMP B-TREE", details)
+
+
+@override_settings(HOT_LISTINGS_BUCKET_SECONDS=60, HOT_LISTINGS_WINDOW_BUCKETS=5, HOT_LISTINGS_SIZE=2)
+class HotListingsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        category = Category.objects.create(name="Vinyl")
+        cls.listings = [
+            Listing.objects.create(
+                title=f"Album {n}", description="", image_url="", bid_current=10,
+                seller=cls.seller, category=category,
+            )
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        hot_cache().clear()
+        fragment_cache().clear()
+
+    def test_ranking_slides_with_the_window(self):
+        first, second, third = [listing.id for listing in self.listings]
+        now = 6000.0
+        for _ in range(3):
+            record_bid(first, now=now - 200)
+        record_bid(second, now=now - 10)
+        record_bid(third, now=now)
+        record_bid(third, now=now)
+        self.assertEqual(hot_listing_ids(now=now), [first, third])
+        self.assertEqual(hot_listing_ids(limit=3, now=now), [first, third, second])
+        # a minute later the first listing's bucket has left the window
+        self.assertEqual(hot_listing_ids(now=now + 60), [third, second])
+
+    def test_only_committed_bids_are_counted(self):
+        accepted, rejected = self.listings[:2]
+        with self.captureOnCommitCallbacks(execute=True):
+            place_bid(accepted.id, self.bidder, 15)
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(BidRejected):
+                place_bid(rejected.id, self.bidder, 5)
+        self.assertEqual(hot_listing_ids(limit=3), [accepted.id])
+
+    def test_concurrent_bids_are_all_counted(self):
+        now = 6000.0
+        listing_ids = [listing.id for listing in self.listings]
+
+        def bid(listing_id):
+            for _ in range(50):
+                record_bid(listing_id, now=now)
+
+        threads = [threading.Thread(target=bid, args=(listing_id,)) for listing_id in listing_ids * 4]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        record_bid(listing_ids[0], now=now)
+        self.assertEqual(hot_listing_ids(limit=3, now=now), [listing_ids[0], listing_ids[2], listing_ids[1]])
+        self.assertEqual(hot_cache().get(HOT_COUNT_KEY.format(int(now // 60), listing_ids[0])), 201)
+
+    def test_ranking_is_kept_for_a_few_seconds(self):
+        first, second = [listing.id for listing in self.listings[:2]]
+        record_bid(first)
+        self.assertEqual(hot_listing_ids(), [first])
+        record_bid(second)
+        record_bid(second)
+        self.assertEqual(hot_listing_ids(), [first])
+        # as if RANKING_SECONDS had passed
+        hot_cache().delete(HOT_RANKING_KEY.format(settings.HOT_LISTINGS_SIZE))
+        self.assertEqual(hot_listing_ids(), [second, first])
+
+    def test_index_renders_the_strip_from_one_query(self):
+        for listing in self.listings[1:]:
+            record_bid(listing.id)
+        record_bid(self.listings[2].id)
+        response = self.client.get(reverse("index"))
+        self.assertEqual([listing.id for listing in response.context["hot"]],
+                         [self.listings[2].id, self.listings[1].id])
+        self.assertContains(response, "Most active right now")
+        # freshness marker + the hot cards + one joined page of listings
+        with self.assertNumQueries(3):
+            self.client.get(reverse("index"))
+        self.assertEqual(self.client.get(reverse("index"), {"after": self.listings[0].id}).context["hot"], [])
+
+
+class CommentThreadTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="", image_url="", seller=cls.seller,
+            category=Category.objects.create(name="Vinyl"),
+        )
+        authors = [User.objects.create_user(f"fan{n}", f"fan{n}@example.com", "secret") for n in range(3)]
+        cls.comments = Comment.objects.bulk_create([
+            Comment(listing=cls.listing, author=authors[n % 3], message=f"Comment {n}")
+            for n in range(COMMENT_PAGE_SIZE * 2 + 5)
+        ])
+
+    def setUp(self):
+        listing_cache().clear()
+
+    def test_listing_page_shows_the_newest_page(self):
+        response = self.client.get(reverse("listing", args=(self.listing.id,)))
+        page = response.context["comments"]
+        self.assertEqual(len(page), COMMENT_PAGE_SIZE)
+        self.assertEqual(page.items[0].message, f"Comment {COMMENT_PAGE_SIZE * 2 + 4}")
+        self.assertContains(response, f"?after={page.next_cursor}")
+
+    def test_fragment_walks_back_to_the_first_comment(self):
+        url = reverse("listing_comments", args=(self.listing.id,))
+        seen, after = [], None
+        while True:
+            # one joined query per page, however many authors
+            with self.assertNumQueries(1):
+                response = self.client.get(url, {"after": after} if after else {})
+            page = response.context["comments"]
+            seen += [comment.message for comment in page]
+            self.assertNotContains(response, "<html")
+            if not page.has_next:
+                self.assertNotContains(response, "load-older-comments")
+                break
+            after = page.next_cursor
+        self.assertEqual(seen, [f"Comment {n}" for n in reversed(range(COMMENT_PAGE_SIZE * 2 + 5))])
+
+    def test_comment_pages_use_the_listing_index(self):
+        with CaptureQueriesContext(connection) as ctx:
+            page = comment_page(self.listing.id, after=self.comments[-1].id)
+        with connection.cursor() as cursor:
+            cursor.execute("EXPLAIN QUERY PLAN " + ctx.captured_queries[0]["sql"])
+            details = " ".join(row[3] for row in cursor.fetchall())
+        self.assertIn("comment_listing_id_idx", details)
+        self.assertNotIn("TEMP B-TREE", details)
+        self.assertEqual(len(page), COMMENT_PAGE_SIZE)
+
+
+class WriteCommandTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.bidder = User.objects.create_user("bidder", "bidder@example.com", "secret")
+        cls.listing = Listing.objects.create(
+            title="Album", description="", image_url="", bid_current=10, seller=cls.seller,
+            category=Category.objects.create(name="Vinyl"),
+        )
+
+    def setUp(self):
+        listing_cache().clear()
+        self.client.force_login(self.bidder)
+        self.url = reverse("listing", args=(self.listing.id,))
+
+    def test_bid_only_writes_and_redirects(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "20"})
+        self.assertRedirects(response, self.url, fetch_redirect_response=False)
+        statements = {query["sql"].split()[0] for query in ctx.captured_queries}
+        # the user (the session is cached), then the conditional UPDATE and the Bid INSERT
+        self.assertEqual(statements - {"SAVEPOINT", "RELEASE"}, {"SELECT", "UPDATE", "INSERT"})
+        self.assertEqual(len([q for q in ctx.captured_queries if q["sql"].startswith("SELECT")]), 1)
+        self.assertContains(self.client.get(self.url), '<span id="listing-price">20.00</span>')
+
+    def test_rejections_come_back_as_a_message_once(self):
+        response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "5"}, follow=True)
+        self.assertContains(response, "Your bid must be higher than the current bid.")
+        first = self.client.get(self.url)
+        self.assertNotContains(first, "Your bid must be higher")
+        self.client.post(reverse("close_auction", args=(self.listing.id,)))
+        # the page version did not change, the message must still beat a 304
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertContains(response, "You haven&#x27;t placed a bid for this listing.")
+
+    def test_fetch_clients_get_json(self):
+        headers = {"HTTP_ACCEPT": "application/json"}
+        response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "25.50"}, **headers)
+        self.assertEqual(response.json(), {"listing": self.listing.id, "bid_current": "25.50"})
+        response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "25"}, **headers)
+        self.assertEqual(response.status_code, 409)
+        response = self.client.post(reverse("add_bid", args=(self.listing.id,)), {"bid_amount": "x"}, **headers)
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse("close_auction", args=(self.listing.id,)), **headers)
+        self.assertEqual(response.json(), {"listing": self.listing.id, "is_active": False})
+        self.assertFalse(Listing.objects.get(pk=self.listing.pk).is_active)
+
+    def test_write_views_refuse_get(self):
+        for name in ("add_bid", "add_comment", "close_auction"):
+            self.assertEqual(self.client.get(reverse(name, args=(self.listing.id,))).status_code, 405)
+
+
+class WatchlistCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("watcher", "watcher@example.com", "secret")
+        category = Category.objects.create(name="Vinyl")
+        cls.listings = [
+            Listing.objects.create(
+                title=f"Album {n}", description="", image_url="", bid_current=10, seller=cls.user,
+                category=category,
+            )
+            for n in range(3)
+        ]
+
+    def setUp(self):
+        listing_cache().clear()
+        fragment_cache().clear()
+        self.client.force_login(self.user)
+
+    def watch_queries(self, ctx):
+        return [q for q in ctx.captured_queries if "auctions_userwatchlist" in q["sql"]]
+
+    def test_listing_page_reads_watch_state_from_the_cache(self):
+        listing = self.listings[0]
+        url = reverse("listing", args=(listing.id,))
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertContains(response, "Add to Watchlist")
+        self.assertEqual(self.watch_queries(ctx), [])
+
+        self.client.post(reverse("add_watchlist", args=(listing.id,)))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertContains(response, "Remove from Watchlist")
+        self.client.post(reverse("remove_watchlist", args=(listing.id,)))
+        self.assertContains(self.client.get(url), "Add to Watchlist")
+
+    def test_grid_shows_watch_state_without_extra_queries(self):
+        self.client.post(reverse("add_watchlist", args=(self.listings[1].id,)))
+        self.client.get(reverse("index"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("index"))
+        self.assertEqual(response.content.decode().count(">Watching</span>"), 1)
+        self.assertEqual(self.watch_queries(ctx), [])
+
+    def test_add_and_remove_are_single_writes(self):
+        listing = self.listings[0]
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.post(reverse("add_watchlist", args=(listing.id,)))
+            self.assertEqual(len(self.watch_queries(ctx)), 1)
+        self.assertEqual(UserWatchlist.objects.filter(user=self.user).count(), 1)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.post(reverse("remove_watchlist", args=(listing.id,)))
+        self.assertEqual(len(self.watch_queries(ctx)), 1)
+        self.assertFalse(UserWatchlist.objects.filter(user=self.user).exists())
+
+    def test_bulk_endpoint(self):
+        url = reverse("api_watchlist_bulk")
+        ids = [listing.id for listing in self.listings]
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {"add": ids}, content_type="application/json")
+        self.assertEqual(response.json(), {"added": ids, "removed": []})
+        self.assertEqual(len(self.watch_queries(ctx)), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post(url, {"remove": ids[:2]}, content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.watch_queries(ctx)), 1)
+        self.assertEqual(list(UserWatchlist.objects.values_list("listing_id", flat=True)), ids[2:])
+
+        response = self.client.post(url, {"add": [ids[0], 999999]}, content_type="application/json")
+        self.assertEqual(response.status_code, 404)
+        response = self.client.post(url, {"add": ["x"]}, content_type="application/json")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(UserWatchlist.objects.values_list("listing_id", flat=True)), ids[2:])
+
+
+class ListSink:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, notifications):
+        self.sent.append(list(notifications))
+
+
+class NotificationOutboxTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.seller = User.objects.create_user("seller", "seller@example.com", "secret")
+        cls.watchers = [
+            User.objects.create_user(f"watcher{n}", f"watcher{n}@example.com", "secret") for n in range(5)
+        ]
+        category = Category.objects.create(name="Vinyl")
+        cls.listings = [
+            Listing.objects.create(
+                title=f"Album {n}", description="", image_url="", bid_current=10, seller=cls.seller,
+                category=category,
+            )
+            for n in range(2)
+        ]
+        UserWatchlist.objects.bulk_create(
+            [UserWatchlist(user=user, listing=listing) for user in cls.watchers for listing in cls.listings]
+        )
+
+    def test_events_are_written_with_the_change_only(self):
+        place_bid(self.listings[0].id, self.watchers[0], 20)
+        with self.assertRaises(BidRejected):
+            place_bid(self.listings[0].id, self.watchers[1], 15)
+        close_auction(self.listings[0].id, self.watchers[0])
+        self.assertEqual(
+            list(OutboxEvent.objects.order_by("id").values_list("kind", "amount")),
+            [("bid", Decimal("20.00")), ("closed", None)],
+        )
+
+    def test_closing_twice_changes_nothing(self):
+        listing = self.listings[0]
+        place_bid(listing.id, self.watchers[0], 20)
+        close_auction(listing.id, self.watchers[0])
+        updated_at = Listing.objects.get(pk=listing.pk).updated_at
+        with self.assertRaisesMessage(CloseRejected, "This auction is already closed."):
+            close_auction(listing.id, self.watchers[0])
+        self.assertEqual(Listing.objects.get(pk=listing.pk).updated_at, updated_at)
+        self.assertEqual(OutboxEvent.objects.filter(kind=OutboxEvent.CLOSED).count(), 1)
+
+    def test_close_writes_before_it_reads(self):
+        listing = self.listings[0]
+        place_bid(listing.id, self.watchers[0], 20)
+        # a read first would take a shared lock SQLite cannot upgrade under contention
+        with CaptureQueriesContext(connection) as ctx:
+            close_auction(listing.id, self.watchers[0])
+        statements = [
+            query["sql"] for query in ctx.captured_queries if query["sql"].startswith(("SELECT", "UPDATE"))
+        ]
+        self.assertTrue(statements[0].startswith("UPDATE"), statements[0])
+        with self.assertRaisesMessage(CloseRejected, "You haven't placed a bid for this listing."):
+            close_auction(self.listings[1].id, self.watchers[1])
+
+    def test_bursts_are_coalesced_per_user(self):
+        first, second = self.listings
+        for amount in (20, 30, 40):
+            place_bid(first.id, self.watchers[0], amount)
+        place_bid(second.id, self.watchers[1], 50)
+        sink = ListSink()
+        # one user per chunk, a user's listings must still arrive in one notification
+        self.assertEqual(drain_outbox(sink, batch_size=2, chunk_size=1), (4, 9))
+        self.assertFalse(OutboxEvent.objects.exists())
+        # the first batch holds two bids on the same listing, the watchers hear about 30
+        self.assertEqual(
+            {(n["username"], u["amount"]) for batch in sink.sent[:4] for n in batch for u in n["updates"]},
+            {(f"watcher{n}", Decimal("30.00")) for n in range(1, 5)},
+        )
+        second_batch = {n["username"]: n["updates"] for batch in sink.sent[4:] for n in batch}
+        # the bidder is not told about their own bids
+        self.assertEqual([u["listing"] for u in second_batch["watcher0"]], [second.id])
+        self.assertEqual([u["listing"] for u in second_batch["watcher1"]], [first.id])
+        self.assertEqual(
+            [(u["listing"], u["amount"]) for u in second_batch["watcher2"]],
+            [(first.id, Decimal("40.00")), (second.id, Decimal("50.00"))],
+        )
+
+    def test_closing_supersedes_bids_and_names_the_winner(self):
+        listing = self.listings[0]
+        place_bid(listing.id, self.watchers[0], 20)
+        place_bid(listing.id, self.watchers[1], 25)
+        close_auction(listing.id, self.watchers[1])
+        sink = ListSink()
+        with self.assertNumQueries(5):
+            # events, listings, watchers, delete, end of outbox
+            drain_outbox(sink)
+        updates = {n["username"]: n["updates"] for n in sink.sent[0]}
+        self.assertEqual(len(updates), 5)
+        self.assertEqual(updates["watcher1"], [{
+            "listing": listing.id, "title": "Album 0", "event": "closed", "amount": Decimal("25.00"), "won": True,
+        }])
+        self.assertFalse(updates["watcher0"][0]["won"])
+
+    def test_file_sink_and_command(self):
+        place_bid(self.listings[1].id, self.watchers[0], 20)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "notifications.jsonl")
+            with override_settings(NOTIFICATION_FILE=path):
+                output = io.StringIO()
+                call_command(
+                    "deliver_notifications", sink="auctions.notifications.FileSink", stdout=output
+                )
+                with open(path) as lines:
+                    written = [json.loads(line) for line in lines]
+        self.assertIn("Delivered 4 notifications for 1 events", output.getvalue())
+        self.assertEqual(written[0]["updates"][0]["amount"], "20.00")
+        self.assertEqual({line["username"] for line in written}, {"watcher1", "watcher2", "watcher3", "watcher4"})
+
+    def test_email_sink(self):
+        place_bid(self.listings[0].id, self.watchers[0], 20)
+        place_bid(self.listings[1].id, self.watchers[0], 30)
+        drain_outbox(get_sink("auctions.notifications.EmailSink"))
+        self.assertEqual(len(mail.outbox), 4)
+        self.assertEqual(mail.outbox[0].subject, "2 listings on your watchlist changed")
+        self.assertIn("Album 1 has a new high bid of $30.00.", mail.outbox[0].body)
+
+
+class SessionCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("member", "member@example.com", "secret")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def test_signed_in_requests_skip_session_and_user_queries(self):
+        url = reverse("search")
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        tables = " ".join(query["sql"] for query in ctx.captured_queries)
+        self.assertNotIn("django_session", tables)
+        self.assertNotIn('FROM "auctions_user"', tables)
+
+    def test_saving_the_user_drops_the_cached_copy(self):
+        self.client.get(reverse("search"))
+        self.assertIsNotNone(user_cache().get(USER_KEY.format(self.user.pk)))
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(user_cache().get(USER_KEY.format(self.user.pk)))
+        response = self.client.get(reverse("search"))
+        self.assertFalse(response.wsgi_request.user.is_authenticated)
+
+    def test_per_process_session_caches_are_refused(self):
+        local = {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+        with override_settings(CACHES={**settings.CACHES, "sessions": local}):
+            self.assertEqual([error.id for error in check_shared_caches(None)], ["auctions.E001"])
+            with override_settings(DEBUG=True):
+                self.assertEqual(check_shared_caches(None), [])
+        self.assertEqual(check_shared_caches(None), [])
+
+    def test_benchmark_shows_the_saved_queries(self):
+        generate_data(users=3, categories=2, listings=10, bids=1, comments=1)
+        results = compare_session_backends(requests=3)
+        for view in ("index", "listing_by_id"):
+            saved = results["db"][view]["queries_per_request"] - results["cached_db"][view]["queries_per_request"]
+            self.assertGreaterEqual(saved, 2, view)
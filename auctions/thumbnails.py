@@ -0,0 +1,285 @@
+import hashlib
+import io
+import ipaddress
+import logging
+import os
+import socket
+import urllib.request
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+
+from .cache import invalidate_listing
+from .models import Listing
+
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {"WEBP": "webp", "JPEG": "jpg"}
+# formats accepted as uploads, saved under the extension of the detected format
+UPLOAD_EXTENSIONS = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp", "GIF": "gif"}
+
+
+class SourceError(ValueError):
+    pass
+
+
+def pillow():
+    # Pillow is only needed where images are processed, the site runs without it
+    try:
+        from PIL import Image, ImageOps, features
+    except ImportError:
+        raise ImproperlyConfigured("Thumbnails need Pillow, install it with `pip install Pillow`.")
+    return Image, ImageOps, features
+
+
+def output_format():
+    _, _, features = pillow()
+    wanted = getattr(settings, "THUMBNAIL_FORMAT", "WEBP")
+    # JPEG everywhere libwebp is missing
+    return wanted if wanted != "WEBP" or features.check("webp") else "JPEG"
+
+
+# ---- start image processing ----
+def render_variants(data, sizes, image_format, quality):
+    """Decode one source image and encode every size in ``sizes``.
+
+    Runs in the worker processes: bytes in, bytes out, no database or storage access.
+    """
+    Image, ImageOps, _ = pillow()
+    with Image.open(io.BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert("RGB")
+        variants = {}
+        for variant, size in sizes.items():
+            resized = image.copy()
+            resized.thumbnail(size, Image.LANCZOS)
+            output = io.BytesIO()
+            resized.save(output, image_format, quality=quality)
+            variants[variant] = output.getvalue()
+    return variants
+
+
+def _render_task(task):
+    listing_id, data, sizes, image_format, quality = task
+    try:
+        return listing_id, render_variants(data, sizes, image_format, quality), None
+    except Exception as error:  # anything Pillow cannot decode
+        return listing_id, None, f"{type(error).__name__}: {error}"
+
+
+def hashed_name(directory, content, extension):
+    # the name changes with the content, so files can be cached forever
+    return f"{directory}/{hashlib.sha256(content).hexdigest()[:32]}.{extension}"
+
+
+def store(name, content):
+    # identical content has the same name, it is written once
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+# ---- end image processing ----
+
+
+# ---- start sources ----
+def upload_format(content):
+    # the client's file name and content type are not trusted: the bytes must decode
+    # as one of the accepted image formats, anything else (HTML, SVG...) is refused
+    try:
+        Image, _, _ = pillow()
+    except ImproperlyConfigured:
+        raise SourceError("Image uploads are not available.")
+    try:
+        with Image.open(io.BytesIO(content)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception:  # anything Pillow cannot decode
+        image_format = None
+    if image_format not in UPLOAD_EXTENSIONS:
+        raise SourceError("Upload a JPEG, PNG, WebP or GIF image.")
+    return image_format
+
+
+def save_upload(uploaded_file):
+    limit = settings.THUMBNAIL_MAX_SOURCE_BYTES
+    if uploaded_file.size > limit:
+        raise SourceError(f"Images must be smaller than {limit // (1024 * 1024)} MB.")
+    content = uploaded_file.read()
+    extension = UPLOAD_EXTENSIONS[upload_format(content)]
+    return store(hashed_name("listings/originals", content, extension), content)
+
+
+def local_source_path(image_url):
+    # local-file mode: relative paths and file:// URLs resolve inside THUMBNAIL_SOURCE_ROOT only
+    root = getattr(settings, "THUMBNAIL_SOURCE_ROOT", None)
+    if not root:
+        return None
+    parsed = urlparse(image_url)
+    if parsed.scheme == "file":
+        relative = parsed.path
+    elif parsed.scheme:
+        return None
+    else:
+        relative = image_url
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, relative.lstrip("/")))
+    if os.path.commonpath([root, path]) != root:
+        raise SourceError(f"{image_url!r} is outside THUMBNAIL_SOURCE_ROOT.")
+    return path
+
+
+def _read_limited(stream, limit):
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise SourceError(f"source is larger than {limit} bytes")
+    return data
+
+
+class RefuseRedirects(urllib.request.HTTPRedirectHandler):
+    # a public host could otherwise bounce the worker to an internal one
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        raise SourceError(f"redirect to {newurl!r} not followed")
+
+
+def check_public_host(image_url):
+    """Refuse URLs whose host resolves to a private, loopback, link-local or otherwise
+    non-public address, so seller supplied URLs can't reach internal services."""
+    parsed = urlparse(image_url)
+    if not parsed.hostname:
+        raise SourceError(f"unsupported image location {image_url!r}")
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        addresses = socket.getaddrinfo(parsed.hostname, port, type=socket.SOCK_STREAM)
+    except (OSError, UnicodeError, ValueError) as error:
+        raise SourceError(f"cannot resolve {parsed.hostname!r}: {error}")
+    for *_, sockaddr in addresses:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise SourceError(f"{parsed.hostname!r} resolves to the non-public address {address}")
+
+
+def read_source(image_source, image_url):
+    limit = settings.THUMBNAIL_MAX_SOURCE_BYTES
+    if image_source:
+        with default_storage.open(image_source) as stream:
+            return _read_limited(stream, limit)
+    path = local_source_path(image_url)
+    if path is not None:
+        with open(path, "rb") as stream:
+            return _read_limited(stream, limit)
+    if urlparse(image_url).scheme not in ("http", "https"):
+        raise SourceError(f"unsupported image location {image_url!r}")
+    if not getattr(settings, "THUMBNAIL_FETCH_REMOTE", False):
+        raise SourceError("remote images are not fetched (THUMBNAIL_FETCH_REMOTE is off)")
+    # the name is resolved again by urlopen, a DNS answer changing in between is not
+    # caught here: keep the workers on a network without access to internal services
+    check_public_host(image_url)
+    opener = urllib.request.build_opener(RefuseRedirects)
+    with opener.open(image_url, timeout=settings.THUMBNAIL_FETCH_TIMEOUT) as response:
+        return _read_limited(response, limit)
+
+
+def _read_task(row):
+    listing_id, image_source, image_url = row
+    try:
+        return listing_id, read_source(image_source, image_url), None
+    except (OSError, ValueError) as error:
+        return listing_id, None, str(error)
+# ---- end sources ----
+
+
+# ---- start worker pool ----
+def pending_listings():
+    # served by the partial index on listings without thumbnails
+    pending = Listing.objects.filter(thumbnail="", thumbnail_failed=False).exclude(
+        Q(image_source="") & Q(image_url="")
+    )
+    if not getattr(settings, "THUMBNAIL_FETCH_REMOTE", False):
+        # linked images are skipped, not failed: they wait for remote fetching
+        pending = pending.exclude(
+            Q(image_source="") & (Q(image_url__istartswith="http://") | Q(image_url__istartswith="https://"))
+        )
+    return pending
+
+
+def retry_failed():
+    """Put every failed listing back in the queue, returns how many there were."""
+    return Listing.objects.filter(thumbnail_failed=True).update(thumbnail_failed=False)
+
+
+def process_pending(workers=4, batch_size=50, limit=None):
+    """Make thumbnails for every pending listing, ``workers`` images at a time.
+
+    Sources are read by a thread pool and decoded/encoded by a process pool. With
+    ``workers=0`` everything runs in this process. Returns (processed, failed).
+    """
+    image_format = output_format()
+    extension = EXTENSIONS[image_format]
+    sizes = settings.THUMBNAIL_SIZES
+    quality = settings.THUMBNAIL_QUALITY
+    processed = failed = 0
+    readers = ThreadPoolExecutor(max_workers=max(workers, 1))
+    renderers = ProcessPoolExecutor(max_workers=workers) if workers else None
+    try:
+        while limit is None or processed + failed < limit:
+            size = batch_size if limit is None else min(batch_size, limit - processed - failed)
+            rows = list(
+                pending_listings().order_by("id").values_list("id", "image_source", "image_url")[:size]
+            )
+            if not rows:
+                break
+            tasks, errors = [], {}
+            for listing_id, data, error in readers.map(_read_task, rows):
+                if error is None:
+                    tasks.append((listing_id, data, sizes, image_format, quality))
+                else:
+                    errors[listing_id] = error
+            results = renderers.map(_render_task, tasks) if renderers else map(_render_task, tasks)
+            for listing_id, variants, error in results:
+                if error is None:
+                    save_thumbnails(listing_id, variants, extension)
+                    processed += 1
+                else:
+                    errors[listing_id] = error
+            for listing_id, error in errors.items():
+                logger.warning("thumbnail failed for listing %s: %s", listing_id, error)
+            if errors:
+                # failed listings are not retried until process_thumbnails --retry-failed
+                Listing.objects.filter(id__in=errors).update(thumbnail_failed=True)
+                failed += len(errors)
+    finally:
+        readers.shutdown()
+        if renderers:
+            renderers.shutdown()
+    return processed, failed
+
+
+def save_thumbnails(listing_id, variants, extension):
+    names = {
+        variant: store(hashed_name(f"thumbnails/{variant}", content, extension), content)
+        for variant, content in variants.items()
+    }
+    Listing.objects.filter(pk=listing_id).update(
+        thumbnail=names["card"],
+        image_large=names["large"],
+        updated_at=timezone.now(),
+    )
+    invalidate_listing(listing_id)
+# ---- end worker pool ----
+
+
+def serve_media(request, path):
+    # local-file mode: Django serves MEDIA_ROOT, hashed names are cached for a year
+    response = serve(request, path, document_root=settings.MEDIA_ROOT)
+    if response.status_code == 200:
+        patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE, immutable=True)
+    return response
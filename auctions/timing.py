@@ -0,0 +1,62 @@
+import heapq
+import time
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template
+
+
+# timings of the request being served, None outside the timing middleware
+current_timing = ContextVar("current_timing", default=None)
+
+
+class RequestTiming:
+    def __init__(self, slow_queries=3):
+        self.slow_queries = slow_queries
+        self.query_count = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self._slowest = []
+
+    def record_query(self, execute, sql, params, many, context):
+        # connection.execute_wrapper hook
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.query_count += 1
+            self.db_seconds += duration
+            entry = (duration, self.query_count, sql)
+            if len(self._slowest) < self.slow_queries:
+                heapq.heappush(self._slowest, entry)
+            else:
+                heapq.heappushpop(self._slowest, entry)
+
+    def slowest(self):
+        return [
+            {"ms": round(duration * 1000, 3), "sql": sql[:300]}
+            for duration, _, sql in sorted(self._slowest, reverse=True)
+        ]
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = current_timing.get()
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_seconds += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    # the stock Django backend, with render time reported to the timing middleware
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -1,12 +1,15 @@
 from django.urls import path
 
-from . import views
+from . import api, views
 
 urlpatterns = [
     path("", views.index, name="index"),
     # individual listing
     path("listing/<str:listing_id>", views.listing_by_id, name="listing"),
+    path("listing/<int:listing_id>/events", views.listing_events, name="listing_events"),
+    path("listing/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
     path("category/<str:slug>", views.category_listings, name="category_listings"),
+    path("search", views.search, name="search"),
     path("login", views.login_view, name="login"),
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
@@ -16,5 +19,13 @@ urlpatterns = [
     path("watchlist", views.personal_watchlist, name="watchlist"),
     path("add_comment/<int:listing_id>", views.add_comment, name="add_comment"),
     path("add_bid/<int:listing_id>", views.add_bid, name="add_bid"),
-    path("close_auction/<int:listing_id>", views.close_auction, name="close_auction")
+    path("close_auction/<int:listing_id>", views.close_auction, name="close_auction"),
+    # JSON API
+    path("api/listings", api.listings, name="api_listings"),
+    path("api/listings/<int:listing_id>", api.listing_detail, name="api_listing"),
+    path("api/listings/<int:listing_id>/bids", api.bids, name="api_bids"),
+    path("api/listings/<int:listing_id>/comments", api.comments, name="api_comments"),
+    path("api/watchlist", api.watchlist, name="api_watchlist"),
+    path("api/watchlist/bulk", api.watchlist_bulk, name="api_watchlist_bulk"),
+    path("api/watchlist/<int:listing_id>", api.watchlist_entry, name="api_watchlist_entry"),
 ]
@@ -1,41 +1,102 @@
+from django.contrib import messages
 from django.contrib.auth import authenticate, login, logout
+from django.core.handlers.asgi import ASGIRequest
 from django.db import IntegrityError
-from django.http import HttpResponseRedirect
+from django.http import Http404, HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.views.decorators.http import require_POST
 from django.contrib.auth.decorators import login_required
 
 
 
-from .models import Comment, User, Category, Listing, UserWatchlist, Bid
+from .models import User, Category, Listing
+from .cache import comment_page, get_listing_snapshot, invalidate_listing, watched_ids
+from .conditional import category_marker, conditional_page, index_marker, listing_marker
+from .events import broker, format_event, stream_listing_events
+from .leaderboard import hot_listing_ids
+from .money import parse_amount
+from .pagination import keyset_paginate, parse_cursor
+from .search import parse_search_cursor, search_listings
+from .services import BidRejected, CloseRejected, place_bid, post_comment, unwatch_listings, watch_listings
+from .services import close_auction as close_auction_command
+from .thumbnails import SourceError, save_upload
 
 
-def get_filtered_listings(category_slug=None):
-    active_listings = Listing.objects.filter(is_active=True)
+# columns rendered by the listing cards in the grids
+LISTING_CARD_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "image_url",
+    "bid_current",
+    "category__name",
+    "category__slug",
+    "category__updated_at",
+    "bid_count",
+    "comment_count",
+    "high_bidder__username",
+    # versions the cached card fragments
+    "updated_at",
+    "thumbnail",
+)
+
+
+def listing_cards(queryset):
+    # join the category and leading bidder in the same query instead of one lookup per card
+    return queryset.select_related("category", "high_bidder").only(*LISTING_CARD_FIELDS)
+
+
+def get_filtered_listings(category_slug=None, after=None, before=None):
+    active_listings = listing_cards(Listing.objects.filter(is_active=True))
 
     if category_slug:
-        category = Category.objects.get(slug=category_slug)
-        active_listings = active_listings.filter(category=category)
+        active_listings = active_listings.filter(category__slug=category_slug)
 
-    return active_listings
+    # only one page of listings is loaded, whatever the size of the catalog
+    return keyset_paginate(active_listings, after=after, before=before)
 
 
+def get_hot_listings():
+    # the ranking comes from the cache, one query loads the cards
+    hot_ids = hot_listing_ids()
+    if not hot_ids:
+        return []
+    cards = listing_cards(Listing.objects.filter(id__in=hot_ids, is_active=True))
+    by_id = {listing.id: listing for listing in cards}
+    return [by_id[listing_id] for listing_id in hot_ids if listing_id in by_id]
+
+
+@conditional_page(index_marker)
 def index(request):
     # ---- start list of all listing categories ----
     all_categories = Category.objects.all()
-    category_slug = None
-    if request.method == "POST":
-        category_slug = request.POST['category']
-        if category_slug:
-            return HttpResponseRedirect(reverse('category_listings', kwargs={
-                'slug': category_slug
-            }))
+    # the dropdown submits with GET so the page carries no CSRF token and stays cacheable
+    data = request.POST if request.method == "POST" else request.GET
+    category_slug = data.get('category')
+    if category_slug:
+        return HttpResponseRedirect(reverse('category_listings', kwargs={
+            'slug': category_slug
+        }))
     # ---- end list of all listing categories ----
 
-    active_listings = get_filtered_listings(category_slug)
+    after = parse_cursor(request.GET.get("after"))
+    before = parse_cursor(request.GET.get("before"))
+    active_listings = get_filtered_listings(after=after, before=before)
+    # the dropdown fragment is versioned by the newest category, index_marker has
+    # usually read it already
+    if not hasattr(request, "categories_updated"):
+        request.categories_updated = (
+            all_categories.order_by("-updated_at").values_list("updated_at", flat=True).first()
+        )
     return render(request, "auctions/index.html", {
         "actives": active_listings,
-        "categories": all_categories
+        "categories": all_categories,
+        "categories_updated": request.categories_updated,
+        # the strip only heads the first page
+        "hot": get_hot_listings() if after is None and before is None else [],
     })
 
 
@@ -50,9 +111,32 @@ def create_listing(request):
         title = request.POST["title"]
         description = request.POST["description"]
         image_url = request.POST["image_url"]
-        price = float(request.POST["price"])
+        try:
+            price = parse_amount(request.POST["price"])
+        except ValueError:
+            return render(request, "auctions/create.html", {
+                "categories": Category.objects.all(),
+                "error_message": "The price must be a number with at most two decimals.",
+            })
         category_id = request.POST["category"]
         category = Category.objects.get(pk=category_id)
+        # optional end of the auction, closed by the expiry scheduler
+        try:
+            # None when the field is empty or malformed, ValueError for dates like Feb 30
+            ends_at = parse_datetime(request.POST.get("ends_at", ""))
+        except ValueError:
+            ends_at_error = "The end date is not a valid date."
+        else:
+            if ends_at is not None and timezone.is_naive(ends_at):
+                ends_at = timezone.make_aware(ends_at)
+            ends_at_error = None
+            if ends_at is not None and ends_at <= timezone.now():
+                ends_at_error = "The end date must be in the future."
+        if ends_at_error:
+            return render(request, "auctions/create.html", {
+                "categories": Category.objects.all(),
+                "error_message": ends_at_error,
+            })
         active = request.POST["active"]
         # convert 'active' to boolean
         if active == "on":
@@ -60,70 +144,110 @@ def create_listing(request):
         else:
             is_active = False
         seller = request.user
+        # uploads are kept as originals, process_thumbnails turns them into thumbnails
+        image_source = ""
+        if request.FILES.get("image_file"):
+            try:
+                image_source = save_upload(request.FILES["image_file"])
+            except SourceError as error:
+                return render(request, "auctions/create.html", {
+                    "categories": Category.objects.all(),
+                    "error_message": str(error),
+                })
         # creating new listing
         new_listing = Listing(
             title=title,
             description=description,
             image_url=image_url,
-            bid_current=float(price),
+            bid_current=price,
             is_active=is_active,
             seller=seller,
             category=category,
+            ends_at=ends_at,
+            image_source=image_source,
         )
         # saving to db
         new_listing.save()
+        invalidate_listing(new_listing.id)
         # redirect to index html
         return HttpResponseRedirect(reverse(index))
 # ---- end create listing ----
 
 
 # ---- start display individual listing ----
+@conditional_page(listing_marker)
 def listing_by_id(request, listing_id):
-    listing = Listing.objects.get(id=listing_id)
-    all_comments = Comment.objects.filter(listing=listing)
-    bid = Bid.objects.filter(listing=listing).last()
-    user = request.user
-    if user.is_authenticated:
-        in_watchlist = UserWatchlist.objects.filter(
-            user=user, listing=listing).exists()
-    else:
-        in_watchlist = False
+    # listing and comments are shared by every visitor, read them through the cache,
+    # at least as new as the version the ETag was computed from
+    if not hasattr(request, "listing_updated_at"):
+        listing_marker(request, listing_id)
+    snapshot = get_listing_snapshot(listing_id, request.listing_updated_at)
+    listing = snapshot["listing"]
+    all_comments = snapshot["comments"]
+    # the user's watched ids are cached, no watchlist query on a cache hit
     return render(request, "auctions/listing.html", {
         "listing": listing,
-        "watchlist": in_watchlist,
-        "comments": all_comments,
-        "bid": bid
+        "watchlist": listing.id in watched_ids(request.user),
+        "comments": all_comments
     })
 # ---- end display individual listing ----
 
 
+# ---- start older comments ----
+def listing_comments(request, listing_id):
+    # the next page of the thread, appended in place by the listing page
+    comments = comment_page(listing_id, after=parse_cursor(request.GET.get("after")))
+    return render(request, "auctions/comment_items.html", {
+        "listing_id": listing_id,
+        "comments": comments,
+    })
+# ---- end older comments ----
+
+
+# ---- start listing events ----
+async def listing_events(request, listing_id):
+    # subscribe before reading the price so no bid falls between the two
+    subscription = broker.subscribe(int(listing_id)) if isinstance(request, ASGIRequest) else None
+    current = await Listing.objects.filter(pk=listing_id).values("bid_current").afirst()
+    if current is None:
+        if subscription is not None:
+            broker.unsubscribe(subscription)
+        raise Http404("Listing not found.")
+
+    if subscription is None:
+        # a WSGI worker can't hold the stream open, send the price and let the client poll
+        return HttpResponse(
+            "retry: 5000\n" + format_event("bid", current),
+            content_type="text/event-stream",
+        )
+
+    response = StreamingHttpResponse(
+        stream_listing_events(subscription, current),
+        content_type="text/event-stream",
+    )
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+# ---- end listing events ----
+
+
 # ---- start add/remove watchlist ----
+# a single write each, removing an entry that isn't there and adding one twice are no-ops
 @login_required
+@require_POST
 def remove_watchlist(request, listing_id):
-    # get the listing object
-    listing = Listing.objects.get(pk=listing_id)
-    # get the current user
-    user = request.user
-    # check if there is an entry in the user's watchlist for the listing
-    user_watchlist_entry = UserWatchlist.objects.filter(
-        user=user, listing=listing).first()
-    # if the entry exists, delete it
-    if user_watchlist_entry:
-        user_watchlist_entry.delete()
-    # redirect back to the listing page
-    return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
+    unwatch_listings(request.user, [listing_id])
+    return command_response(request, listing_id, watching=False)
 
 @login_required
+@require_POST
 def add_watchlist(request, listing_id):
-    # get the listing object
-    listing = Listing.objects.get(pk=listing_id)
-    # get the current user
-    user = request.user
-    # if there is no existing entry in the user's watchlist for the listing, create one
-    if not UserWatchlist.objects.filter(user=user, listing=listing).exists():
-        UserWatchlist.objects.create(user=user, listing=listing)
-    # redirect back to the listing page
-    return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
+    try:
+        watch_listings(request.user, [listing_id])
+    except IntegrityError:
+        # the foreign key rejects listings that don't exist
+        return command_response(request, listing_id, error="Listing not found.", status=404)
+    return command_response(request, listing_id, watching=True)
 # ---- end add/remove watchlist ----
 
 
@@ -133,7 +257,7 @@ def personal_watchlist(request):
     # get the current user
     user = request.user
     # get all listings in the user's watchlist
-    listings = Listing.objects.filter(userwatchlist__user=user)
+    listings = listing_cards(Listing.objects.filter(userwatchlist__user=user))
     # render the watchlist template with the listings
     return render(request, "auctions/watchlist.html", {
         "listings": listings
@@ -142,8 +266,13 @@ def personal_watchlist(request):
 
 
 # ---- start list of all listing categories ----
+@conditional_page(category_marker)
 def category_listings(request, slug=None):
-    active_listings = get_filtered_listings(slug)
+    active_listings = get_filtered_listings(
+        slug,
+        after=parse_cursor(request.GET.get("after")),
+        before=parse_cursor(request.GET.get("before")),
+    )
 
     if slug:
         category = Category.objects.get(slug=slug)
@@ -157,117 +286,84 @@ def category_listings(request, slug=None):
 # ---- end list of all listing categories ----
 
 
+# ---- start search listings ----
+def search(request):
+    query = request.GET.get("q", "").strip()
+    results = search_listings(
+        query,
+        after=parse_search_cursor(request.GET.get("after")),
+        before=parse_search_cursor(request.GET.get("before")),
+        queryset=listing_cards(Listing.objects.all()),
+    )
+    return render(request, "auctions/search.html", {
+        "actives": results,
+        "q": query
+    })
+# ---- end search listings ----
+
+
+# ---- start write commands ----
+# the write views only write: browsers are redirected to the listing page (errors
+# travel as messages), fetch clients asking for JSON get a small result instead
+def wants_json(request):
+    accept = request.headers.get("Accept", "")
+    return "application/json" in accept and "text/html" not in accept
+
+
+def command_response(request, listing_id, error=None, status=400, **result):
+    if wants_json(request):
+        if error:
+            return JsonResponse({"error": error}, status=status)
+        return JsonResponse({"listing": listing_id, **result})
+    if error:
+        messages.error(request, error)
+    return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
+# ---- end write commands ----
+
+
 # ---- start add comments ----
 @login_required
+@require_POST
 def add_comment(request, listing_id):
-    user = request.user
-    listing = Listing.objects.get(pk=listing_id)
-    message = request.POST["comment_content"]
-    new_comment = Comment(
-        author=user,
-        listing=listing,
-        message=message
-    )
-    new_comment.save()
-    return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
+    message = request.POST.get("comment_content", "").strip()
+    if not message:
+        return command_response(request, listing_id, "Your comment is empty.")
+    # the comment and the listing's comment count are written together
+    try:
+        comment = post_comment(listing_id, request.user, message)
+    except Listing.DoesNotExist:
+        raise Http404("Listing not found.")
+    return command_response(request, listing_id, comment=comment.id)
 # ---- end add comments ----
 
 
 # ---- start add bids ----
 @login_required
+@require_POST
 def add_bid(request, listing_id):
-    if request.method == "POST":
-        # retrieve the bid amount from the form
-        amount = float(request.POST["bid_amount"])
-        # retrieve the bidder (current user)
-        bidder = request.user
-        # retrieve the listing object based on the listing_id
-        listing = Listing.objects.get(pk=listing_id)
-        # retrieve all comments associated with the listing
-        all_comments = Comment.objects.filter(listing=listing)
-        # retrieve the current user
-        user = request.user
-
-        # check if the user is authenticated
-        if user.is_authenticated:
-            # check if the listing is in the user's watchlist
-            in_watchlist = UserWatchlist.objects.filter(
-                user=user, listing=listing).exists()
-        else:
-            # if user is not authenticated, set in_watchlist to False
-            in_watchlist = False
-
-        # check if the bid amount is greater than the current bid on the listing
-        if amount > listing.bid_current:
-            # create a new bid object
-            bid = Bid(listing=listing, bidder=bidder, amount=amount)
-            bid.save()
-            # update the current bid amount on the listing
-            listing.bid_current = amount
-            listing.save()
-            # render the listing page with relevant information
-            return render(request, 'auctions/listing.html', {
-                'listing': listing,
-                "watchlist": in_watchlist,
-                "comments": all_comments
-            })
-
-    # if the method is not POST, redirect back to the listing page
-    return HttpResponseRedirect(reverse('listing', args=(listing_id,)))
+    # retrieve the bid amount from the form, exact to the cent
+    try:
+        amount = parse_amount(request.POST.get("bid_amount"))
+    except ValueError:
+        return command_response(request, listing_id, "Your bid must be a number with at most two decimals.")
+    try:
+        # the price check and both writes happen in one transaction
+        place_bid(listing_id, request.user, amount)
+    except BidRejected as rejected:
+        return command_response(request, listing_id, str(rejected), status=409)
+    return command_response(request, listing_id, bid_current=amount)
 # ---- end add bids ----
 
 
 # ---- start close auction ----
 @login_required
+@require_POST
 def close_auction(request, listing_id):
-    # retrieve the listing object based on the listing_id
-    listing = Listing.objects.get(pk=listing_id)
-    # retrieve all comments associated with the listing
-    all_comments = Comment.objects.filter(listing=listing)
-    # get the current user
-    user = request.user
-
-    # check if the user is authenticated
-    if user.is_authenticated:
-        # check if the listing is in the user's watchlist
-        in_watchlist = UserWatchlist.objects.filter(
-            user=user, listing=listing).exists()
-    else:
-        # if user is not authenticated, set in_watchlist to False
-        in_watchlist = False
-
-    # check if the user has placed a bid for the listing
-    if Bid.objects.filter(bidder=user, listing=listing).exists():
-        # retrieve the last bid for the listing
-        bid = Bid.objects.filter(listing=listing).last()
-        # check if the bid amount is greater than 0
-        if bid.amount > 0:
-            # set the listing as inactive
-            listing.is_active = False
-            listing.save()
-            # render the listing page with relevant information
-            return render(request, 'auctions/listing.html', {
-                'listing': listing,
-                "watchlist": in_watchlist,
-                "comments": all_comments,
-                "bid": bid,
-            })
-        else:
-            # render the listing page with an error message if bid amount is not valid
-            return render(request, 'auctions/listing.html', {
-                'listing': listing,
-                "watchlist": in_watchlist,
-                "comments": all_comments,
-                "error_message": "Bid amount must be greater than 0.",
-            })
-    else:
-        # render the listing page with an error message if user hasn't placed a bid
-        return render(request, 'auctions/listing.html', {
-            'listing': listing,
-            "watchlist": in_watchlist,
-            "comments": all_comments,
-            "error_message": "You haven't placed a bid for this listing.",
-        })
+    try:
+        close_auction_command(listing_id, request.user)
+    except CloseRejected as rejected:
+        return command_response(request, listing_id, str(rejected), status=409)
+    return command_response(request, listing_id, is_active=False)
 # ---- end close auction ----
 
 
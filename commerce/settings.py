@@ -12,6 +12,8 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 
 import os
 
+from django.contrib.messages import constants as messages
+
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
@@ -41,7 +43,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # opt-in, see REQUEST_TIMING_ENABLED below
+    'auctions.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    # before sessions, so the session read also honours the primary pin
+    'auctions.routers.ReadYourWritesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -54,15 +60,25 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports render time to RequestTimingMiddleware
+        'BACKEND': 'auctions.timing.TimedDjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'auctions.context_processors.fragment_cache',
+                'auctions.context_processors.watchlist',
+            ],
+            # compiled templates are kept in memory, in DEBUG they are still
+            # reloaded when a template file changes
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -78,11 +94,160 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        # keep connections open between requests, checked before reuse
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # seconds a writer waits for the lock before "database is locked"
+            'timeout': 20,
+        },
     }
 }
 
+# Read replicas
+# Reads are spread over DATABASE_REPLICAS, one replica per request so a page and its
+# ETag agree, writes always go to 'default'. Reads that outlive the request stay on
+# 'default': cache fills and sessions. To try it locally with a second SQLite file:
+#
+#   DATABASES['replica'] = {
+#       'ENGINE': 'django.db.backends.sqlite3',
+#       'NAME': os.path.join(BASE_DIR, 'replica.sqlite3'),
+#       'TEST': {'MIRROR': 'default'},
+#   }
+#   DATABASE_REPLICAS = ['replica']
+
+DATABASE_ROUTERS = ['auctions.routers.PrimaryReplicaRouter']
+DATABASE_REPLICAS = []
+# how long a client keeps reading from the primary after one of its writes
+REPLICA_STICKY_SECONDS = 5
+
+# Applied to every new SQLite connection (auctions.sqlite.configure_sqlite).
+# WAL lets readers carry on while a bid is being written.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 20000,
+    'mmap_size': 268435456,
+    'cache_size': -20000,
+}
+
 AUTH_USER_MODEL = 'auctions.User'
 
+
+# Messages left by the write views, rendered as Bootstrap alerts
+
+MESSAGE_TAGS = {messages.ERROR: 'danger'}
+
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+# Swap the backend (e.g. Memcached or Redis) to share cached listings between workers.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auctions',
+    },
+    # {% cache %} fragments: listing cards keyed by listing version and the
+    # category dropdown, sized to hold a few full grids
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # hot listing counters: two entries per listing bid on in each bucket, for the
+    # WINDOW_BUCKETS + 1 buckets alive at a time. Point it at Redis or Memcached to
+    # rank bids from every worker
+    'hot_listings': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hot-listings',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
+    # sessions and signed-in users. Unlike the other caches it must be shared by all
+    # workers: a per-process copy keeps a session alive in one worker after it was
+    # logged out in another, so LocMem is refused unless DEBUG is on (auctions.E001).
+    # Files work for the workers of one host, use Redis or Memcached across hosts
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, 'cache', 'sessions'),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# Sessions and the signed-in user
+# Sessions are read from the cache and written through to the database, the user
+# behind a session is cached by CachedModelBackend: a signed-in page view makes no
+# session or user query while both are cached. Expired sessions are deleted by
+# Django's clearsessions, run daily from cron:
+#   30 4 * * *  cd /path/to/commerce && python manage.py clearsessions
+# or from a systemd timer (OnCalendar=daily) starting the same command.
+# To go back to a query per request, use 'django.contrib.sessions.backends.db'
+# and 'django.contrib.auth.backends.ModelBackend'.
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+AUTHENTICATION_BACKENDS = ['auctions.auth.CachedModelBackend']
+USER_CACHE_ALIAS = 'sessions'
+USER_CACHE_TIMEOUT = 300
+
+# Listing pages (listing, latest bid and comments) are read through this cache
+LISTING_CACHE_ENABLED = True
+LISTING_CACHE_ALIAS = 'default'
+LISTING_CACHE_TIMEOUT = 300
+
+# Each user's set of watched listing ids, dropped whenever the watchlist changes
+WATCHLIST_CACHE_TIMEOUT = 3600
+
+# Listing, category and index pages answer conditional GETs with 304 and, for
+# anonymous visitors, may be kept this many seconds by browsers and the CDN
+PAGE_CACHE_MAX_AGE = 60
+
+# Lifetime of cached template fragments, versioned keys make stale entries unreachable
+FRAGMENT_CACHE_TIMEOUT = 3600
+
+# "Most active right now" strip on the index: bids counted in time buckets kept
+# in this cache, ranked over the last WINDOW_BUCKETS buckets. The ranking itself
+# is cached for RANKING_SECONDS, so the window is read once per interval and not
+# on every index view
+
+HOT_LISTINGS_CACHE_ALIAS = 'hot_listings'
+HOT_LISTINGS_BUCKET_SECONDS = 60
+HOT_LISTINGS_WINDOW_BUCKETS = 15
+HOT_LISTINGS_SIZE = 4
+HOT_LISTINGS_RANKING_SECONDS = 5
+
+# Watchlist notifications: bids and closings go to an outbox table drained by
+# `manage.py deliver_notifications`, which hands them to this sink
+
+NOTIFICATION_SINK = 'auctions.notifications.EmailSink'
+NOTIFICATION_FILE = os.path.join(BASE_DIR, 'notifications.jsonl')
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Request timing
+# Server-Timing headers and one log line per request, with a warning when a
+# request goes over either budget
+
+REQUEST_TIMING_ENABLED = False
+REQUEST_TIMING_QUERY_BUDGET = 10
+REQUEST_TIMING_MS_BUDGET = 200
+REQUEST_TIMING_SLOW_QUERIES = 3
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'auctions.timing': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -120,3 +285,25 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/3.0/howto/static-files/
 
 STATIC_URL = '/static/'
+
+# Uploaded images and generated thumbnails
+# Local-file mode: files live in MEDIA_ROOT and, with DEBUG on, Django serves them.
+# In production point the web server or CDN at MEDIA_ROOT (or swap the storage).
+
+MEDIA_URL = '/media/'
+MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# file names are content hashes, so a served file never changes
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 365
+
+# Thumbnails made by `manage.py process_thumbnails`, card for the grids and
+# large for the listing page
+THUMBNAIL_SIZES = {'card': (320, 320), 'large': (1280, 1280)}
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_QUALITY = 80
+THUMBNAIL_MAX_SOURCE_BYTES = 10 * 1024 * 1024
+# Download remote image_url values. Off by default: the URLs come from sellers, when
+# on only public addresses are fetched and redirects are not followed
+THUMBNAIL_FETCH_REMOTE = False
+THUMBNAIL_FETCH_TIMEOUT = 10
+# relative image_url paths and file:// URLs are read from this directory, None disables it
+THUMBNAIL_SOURCE_ROOT = None